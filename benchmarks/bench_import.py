@@ -0,0 +1,94 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Import-time and fabfile startup benchmark.
+
+Times, in fresh interpreters, importing the package, setting up the
+fabhelper host lists the way load() does, and importing Connection.
+Prints the median of each and the modules the step loaded. Exits
+non-zero if importing the package or setting up fabhelper loads the
+client modules or oauth, which would make every fab --list slow again.
+
+    python benchmarks/bench_import.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Modules that must not be loaded before a request is made.
+HEAVY = ['cloudkick_api.base', 'cloudkick_api.endpoints', 'oauth', 'httplib']
+
+STEPS = [
+    ('import cloudkick_api', "import cloudkick_api", True),
+    ('fabhelper setup',
+     "from cloudkick_api import fabhelper\n"
+     "hosts, roledefs = fabhelper.LazyHosts(), fabhelper.roledefs()", True),
+    ('import Connection', "from cloudkick_api import Connection", False),
+]
+
+TEMPLATE = """
+import sys, time
+sys.path.insert(0, %(root)r)
+before = set(sys.modules)
+start = time.time()
+%(code)s
+elapsed = time.time() - start
+loaded = [m for m in %(heavy)r if m in sys.modules and m not in before]
+print %(marker)r + json.dumps({'seconds': elapsed, 'loaded': loaded})
+"""
+
+MARKER = '@@bench@@'
+
+
+def measure(code):
+    script = "import json\n" + TEMPLATE % {'root': ROOT, 'code': code,
+                                           'heavy': HEAVY, 'marker': MARKER}
+    out = subprocess.Popen([sys.executable, '-c', script],
+                           stdout=subprocess.PIPE).communicate()[0]
+    for line in out.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError("benchmark step failed: %r" % code)
+
+
+def main(runs=15):
+    ok = True
+    for name, code, must_be_light in STEPS:
+        results = [measure(code) for i in xrange(runs)]
+        times = sorted(r['seconds'] for r in results)
+        loaded = results[-1]['loaded']
+        print "%-22s %8.2f ms   loads: %s" % (name, times[len(times) // 2] * 1000,
+                                              ", ".join(loaded) or "-")
+        if must_be_light and loaded:
+            ok = False
+    if not ok:
+        print "FAIL: package import or fabhelper setup loads client modules"
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,69 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmark of request signing alone, without any network I/O.
+
+Compares building the OAuth consumer and signature method for every
+request (as Connection used to) with Connection's cached signing
+context, and prints signed requests per second for each.
+
+    python benchmarks/bench_signing.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from oauth import oauth
+from cloudkick_api import Connection
+
+PARAMS = {'query': 'tag:web', 'is_active': 'true'}
+
+
+def sign_uncached(conn, n):
+    for i in xrange(n):
+        signature_method = oauth.OAuthSignatureMethod_HMAC_SHA1()
+        consumer = oauth.OAuthConsumer(conn.oauth_key, conn.oauth_secret)
+        url = 'https://%s/%s/%s' % (conn.api_server, conn.api_version, 'nodes')
+        oauth_request = oauth.OAuthRequest.from_consumer_and_token(
+            consumer, http_url=url, http_method='GET', parameters=PARAMS)
+        oauth_request.sign_request(signature_method, consumer, None)
+        oauth_request.to_url()
+
+
+def sign_cached(conn, n):
+    for i in xrange(n):
+        conn._sign('nodes', 'GET', PARAMS).to_url()
+
+
+def main(n=20000):
+    conn = Connection(oauth_key='key', oauth_secret='secret')
+    for name, fn in [('per-request', sign_uncached),
+                     ('cached context', sign_cached)]:
+        fn(conn, 100)
+        start = time.time()
+        fn(conn, n)
+        elapsed = time.time() - start
+        print "%-16s %10.0f req/s" % (name, n / elapsed)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,70 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare two result files written by benchmarks/run.py.
+
+    python benchmarks/compare.py before.json after.json
+
+Prints wall time, throughput and peak memory of each scenario present
+in both files, with the relative change.
+"""
+
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+COLUMNS = [('seconds', '%9.3f'), ('requests_per_second', '%9.0f'),
+           ('peak_rss_kb', '%9d')]
+
+
+def _load(path):
+    fp = open(path, 'r')
+    try:
+        return json.load(fp)
+    finally:
+        fp.close()
+
+
+def _change(old, new):
+    if not old:
+        return '      n/a'
+    return '%+8.1f%%' % ((new - old) * 100.0 / old)
+
+
+def main(before, after):
+    before = _load(before)['scenarios']
+    after = _load(after)['scenarios']
+    print "%-16s %-20s %9s %9s %9s" % ('scenario', 'measure', 'before',
+                                       'after', 'change')
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        if 'error' in old or 'error' in new:
+            print "%-16s %s" % (name, old.get('error') or new.get('error'))
+            continue
+        for column, fmt in COLUMNS:
+            print "%-16s %-20s %s %s %s" % (name, column, fmt % old[column],
+                                            fmt % new[column],
+                                            _change(old[column], new[column]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.stderr.write("usage: %s before.json after.json\n" % sys.argv[0])
+        sys.exit(2)
+    main(sys.argv[1], sys.argv[2])
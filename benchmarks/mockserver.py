@@ -0,0 +1,329 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local stand-in for the Cloudkick API, serving a synthetic fleet
+
+Implements the 2.0 endpoints used by cloudkick_api.endpoints and the
+1.0 query/node/... metric endpoints. OAuth signatures are not checked.
+Listings honour offset/length and the tag:/node: query forms, GETs
+carry ETags, and every response can be delayed by a fixed latency.
+With --gzip, bodies are gzipped for clients that accept it.
+
+    python benchmarks/mockserver.py --nodes 2000 --port 8080
+
+Point a Connection at it with api_server="127.0.0.1:<port>".
+"""
+
+import BaseHTTPServer
+import SocketServer
+import cStringIO
+import gzip
+import hashlib
+import optparse
+import socket
+import threading
+import time
+import urlparse
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+PROVIDERS = ['ec2', 'rackspace', 'linode', 'slicehost']
+OSES = ['ubuntu', 'centos', 'debian']
+CHECK_TYPES = ['PING', 'HTTP', 'DISK', 'CPU']
+
+
+class Fleet(object):
+    """Synthetic account: nodes, their checks and metric history"""
+
+    def __init__(self, size=1000, checks_per_node=2, points=288,
+                 interval=300, error_every=50):
+        self.size = size
+        self.points = points
+        self.interval = interval
+        self.nodes = []
+        self.checks = []
+        for i in xrange(size):
+            node_id = 'n%05d' % i
+            self.nodes.append({
+                'id': node_id,
+                'name': 'node%d.example.com' % i,
+                'ipaddress': '10.%d.%d.%d' % (i // 65536, i // 256 % 256,
+                                              i % 256),
+                'is_active': True,
+                'provider': {'id': 'p%d' % (i % len(PROVIDERS)),
+                             'name': PROVIDERS[i % len(PROVIDERS)]},
+                'tags': [{'id': 't%d' % (i % 10), 'name': 'role%d' % (i % 10)},
+                         {'id': 't-env', 'name': 'prod'}],
+                'details': {'os': {'name': OSES[i % len(OSES)],
+                                   'version': '%d.04' % (8 + i % 3)},
+                            'rack': 'r%d' % (i % 40)},
+            })
+            for j in xrange(checks_per_node):
+                self.checks.append({
+                    'id': 'c%05d%d' % (i, j),
+                    'node_id': node_id,
+                    'type': CHECK_TYPES[j % len(CHECK_TYPES)],
+                    'status': 'error' if (i + j) % error_every == 0 else 'ok',
+                })
+        self.changes = []
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def query(self, query):
+        nodes = self.nodes
+        if not query or query == '*':
+            return nodes
+        field, _, value = query.partition(':')
+        if field == 'tag':
+            return [n for n in nodes
+                    if value in [t['name'] for t in n['tags']]]
+        if field == 'node':
+            return [n for n in nodes if n['name'].startswith(value.rstrip('*'))]
+        return nodes
+
+    def tag(self, node_id, name, add):
+        self.lock.acquire()
+        try:
+            for node in self.nodes:
+                if node['id'] == node_id:
+                    names = [t['name'] for t in node['tags']]
+                    if add and name not in names:
+                        node['tags'].append({'id': 't-' + name, 'name': name})
+                    elif not add and name in names:
+                        node['tags'] = [t for t in node['tags']
+                                        if t['name'] != name]
+                    self.changes.append({'node_id': node_id,
+                                         'date': time.time()})
+                    self.version += 1
+                    return True
+            return False
+        finally:
+            self.lock.release()
+
+    def set_status(self, check_id, status):
+        self.lock.acquire()
+        try:
+            for check in self.checks:
+                if check['id'] == check_id:
+                    check['status'] = status
+                    self.version += 1
+                    return True
+            return False
+        finally:
+            self.lock.release()
+
+    def metric_data(self, node_id, name, start=None):
+        end = int(time.time()) // self.interval * self.interval
+        first = end - self.points * self.interval
+        if start:
+            first = max(first, int(start))
+        seed = int(node_id[1:]) if node_id[1:].isdigit() else 0
+        data = []
+        for ts in xrange(first, end, self.interval):
+            avg = (seed + ts // self.interval) % 100 / 10.0
+            data.append({'ts': ts, 'avg': '%.2f' % avg,
+                         'min': '%.2f' % (avg * 0.8),
+                         'max': '%.2f' % (avg * 1.3)})
+        return {'metrics': [{'name': name, 'data': data}]}
+
+
+def _gzip(data):
+    buf = cStringIO.StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def _page(items, params):
+    offset = int(params.get('offset', 0))
+    if 'length' in params:
+        items = items[offset:offset + int(params['length'])]
+    elif offset:
+        items = items[offset:]
+    return items
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer writes so headers and body leave together, and turn off
+    # Nagle so the tail of a large body isn't held back until the client's
+    # delayed ACK; either stalls keep-alive clients for ~40ms a request.
+    wbufsize = -1
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, etag, gzipped=None):
+        if self.command == 'GET' and \
+                self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        if gzipped is not None and \
+                'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzipped
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self, query):
+        return dict((k, v[-1]) for k, v in urlparse.parse_qs(query).iteritems()
+                    if not k.startswith('oauth_'))
+
+    def _route(self, method, path, params):
+        fleet = self.server.fleet
+        parts = path.strip('/').split('/')
+        version, parts = parts[0], parts[1:]
+        if version == '1.0':
+            # query/node/<id>/check/<name> or .../check/plugin/<name>
+            if len(parts) >= 5 and parts[0] == 'query':
+                return 200, fleet.metric_data(parts[2], parts[-1],
+                                              params.get('start'))
+            return 404, {'error': 'not found'}
+
+        endpoint = '/'.join(parts)
+        if method == 'POST':
+            if len(parts) == 3 and parts[0] == 'nodes' and \
+                    parts[2] in ('add_tag', 'remove_tag'):
+                ok = fleet.tag(parts[1], params.get('name') or params.get('id'),
+                               parts[2] == 'add_tag')
+                return (200 if ok else 404), {'success': ok}
+            return 200, {'success': True}
+
+        if endpoint == 'nodes':
+            items = fleet.query(params.get('query'))
+            if 'node_ids' in params:
+                ids = set(params['node_ids'].split(','))
+                items = [n for n in items if n['id'] in ids]
+        elif endpoint == 'checks':
+            items = fleet.checks
+        elif endpoint == 'status/nodes':
+            statuses = params.get('overall_check_statuses')
+            items = []
+            by_node = {}
+            for check in fleet.checks:
+                if statuses and check['status'] == 'ok':
+                    continue
+                by_node.setdefault(check['node_id'], []).append(check)
+            for node_id in sorted(by_node):
+                items.append({'node_id': node_id, 'checks': by_node[node_id]})
+        elif endpoint == 'change_logs':
+            items = list(fleet.changes)
+        elif endpoint == 'tags':
+            items = [{'id': 't%d' % i, 'name': 'role%d' % i}
+                     for i in xrange(10)]
+        elif endpoint in ('check_types', 'provider_types', 'address_types',
+                          'providers', 'addresses', 'monitors',
+                          'monitoring_servers', 'interesting_metrics'):
+            items = []
+        else:
+            return 404, {'error': 'not found'}
+        return 200, {'items': _page(items, params), 'total': len(items)}
+
+    def _handle(self, method, body=''):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlparse.urlsplit(self.path)
+        params = self._params(url.query)
+        params.update(self._params(body))
+        server.count()
+        # Rendering big listings would otherwise dominate the numbers, so
+        # GET responses are kept until the fleet changes.
+        key = None
+        if method == 'GET':
+            key = (server.fleet.version,
+                   int(time.time()) // server.fleet.interval,
+                   url.path, tuple(sorted(params.iteritems())))
+            cached = server.responses.get(key)
+            if cached is not None:
+                self._send(*cached)
+                return
+        status, obj = self._route(method, url.path, params)
+        body = json.dumps(obj)
+        response = (status, body, '"%s"' % hashlib.sha1(body).hexdigest(),
+                    server.compress and _gzip(body) or None)
+        if key is not None and status == 200:
+            server.responses[key] = response
+        self._send(*response)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle('POST', self.rfile.read(length))
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fleet, latency=0.0, port=0, compress=False):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.fleet = fleet
+        self.latency = latency
+        self.compress = compress
+        self.requests = 0
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def count(self):
+        self._lock.acquire()
+        try:
+            self.requests += 1
+        finally:
+            self._lock.release()
+
+    @property
+    def api_server(self):
+        return '127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        """Serve from a background thread"""
+        t = threading.Thread(target=self.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('--nodes', type='int', default=1000)
+    parser.add_option('--latency', type='float', default=0.0,
+                      help="seconds to delay each response")
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--gzip', action='store_true', default=False,
+                      help="gzip responses when the client accepts it")
+    options, args = parser.parse_args()
+    server = MockServer(Fleet(options.nodes), options.latency, options.port,
+                        options.gzip)
+    print "Serving %d nodes on %s" % (options.nodes, server.api_server)
+    server.serve_forever()
@@ -0,0 +1,255 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline benchmarks of the client against the local mock server.
+
+Starts benchmarks/mockserver.py in-process with a synthetic fleet and
+runs each scenario in a forked child, so the peak memory reported for
+a scenario is its own. For every scenario the JSON output has the wall
+time, API requests per second, per-endpoint latency percentiles from
+a LatencyAggregator hook, and peak RSS in KB.
+
+    python benchmarks/run.py [--nodes 1000] [--latency 0.005]
+                             [--repeat 5] [--output results.json]
+                             [scenario ...]
+
+Compare two result files with benchmarks/compare.py.
+"""
+
+import optparse
+import os
+import resource
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from cloudkick_api import Connection
+from cloudkick_api import fabhelper
+from cloudkick_api.instrument import LatencyAggregator
+from cloudkick_api.metrics import MetricSeries
+from cloudkick_api.pipeline import MetricPipeline
+
+from mockserver import Fleet, MockServer
+
+ROLE_QUERIES = ['tag:role%d' % i for i in xrange(10)] + \
+    ['node:node1*', 'tag:prod', '*']
+
+
+def nodes_read(conn, options):
+    for i in xrange(options.repeat):
+        conn.nodes.read()
+
+
+def nodes_iter(conn, options):
+    for i in xrange(options.repeat):
+        for node in conn.nodes.iter(page_size=100):
+            pass
+
+
+def status_iter(conn, options):
+    for i in xrange(options.repeat):
+        for status in conn.status_nodes.iter():
+            pass
+
+
+def tag_many(conn, options):
+    ids = [n['id'] for n in conn.nodes.read()['items']]
+    results = conn.nodes.tag_many(ids, tag_name='bench',
+                                  max_workers=options.workers)
+    conn.nodes.tag_many(ids, tag_name='bench', op='remove',
+                        max_workers=options.workers)
+    failed = [r for r in results.itervalues() if isinstance(r, Exception)]
+    if failed:
+        raise failed[0]
+
+
+def _roles(conn, options, use_index):
+    # fabhelper builds its own Connection from the config file; point it
+    # at the mock server instead.
+    fabhelper._connection = lambda: conn
+    fabhelper.use_node_index(use_index)
+    for i in xrange(options.repeat):
+        fabhelper._QUERY_CACHE.clear()
+        fabhelper.use_node_index(use_index)
+        rd = fabhelper.roledefs()
+        for query in ROLE_QUERIES:
+            query in rd
+
+
+def fab_roles(conn, options):
+    _roles(conn, options, False)
+
+
+def fab_roles_index(conn, options):
+    _roles(conn, options, True)
+
+
+def metric_fetch(conn, options):
+    ids = [n['id'] for n in conn.nodes.read()['items']]
+    for node_id, result in conn.nodes.metric_data_many(
+            ids, 'avg_ms', max_workers=options.workers):
+        if isinstance(result, Exception):
+            raise result
+
+
+def metric_summary(conn, options):
+    ids = [n['id'] for n in conn.nodes.read()['items']]
+    for node_id, result in conn.nodes.metric_data_many(
+            ids, 'avg_ms', max_workers=options.workers):
+        if isinstance(result, Exception):
+            raise result
+        MetricSeries.from_response(result).summary()
+
+
+def metric_pipeline(conn, options):
+    ids = [n['id'] for n in conn.nodes.read()['items']]
+    pipeline = MetricPipeline(conn, io_workers=options.workers)
+    try:
+        for node_id, result in pipeline.map(ids, 'avg_ms'):
+            if isinstance(result, Exception):
+                raise result
+    finally:
+        pipeline.close()
+
+
+SCENARIOS = [
+    ('nodes_read', nodes_read),
+    ('nodes_iter', nodes_iter),
+    ('status_iter', status_iter),
+    ('tag_many', tag_many),
+    ('fab_roles', fab_roles),
+    ('fab_roles_index', fab_roles_index),
+    ('metric_fetch', metric_fetch),
+    ('metric_summary', metric_summary),
+    ('metric_pipeline', metric_pipeline),
+]
+
+
+def run_scenario(server, fn, options):
+    """Run fn in a forked child and return its measurements"""
+    # The server keeps running in this process, so the child's request
+    # count is read back from the server rather than from the child.
+    rfd, wfd = os.pipe()
+    before = server.requests
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        status = 0
+        try:
+            try:
+                conn = Connection(oauth_key='key', oauth_secret='secret',
+                                  api_server=server.api_server,
+                                  compress=not options.identity)
+                agg = LatencyAggregator()
+                conn.add_hook(agg)
+                start = time.time()
+                fn(conn, options)
+                result = {'seconds': time.time() - start,
+                          'latency': agg.report(),
+                          'peak_rss_kb': resource.getrusage(
+                              resource.RUSAGE_SELF).ru_maxrss}
+                conn.close()
+            except Exception, e:
+                result = {'error': repr(e)}
+                status = 1
+            os.write(wfd, json.dumps(result))
+        finally:
+            os._exit(status)
+    os.close(wfd)
+    chunks = []
+    while True:
+        chunk = os.read(rfd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    result = json.loads(''.join(chunks))
+    if 'seconds' in result:
+        result['requests'] = server.requests - before
+        result['requests_per_second'] = result['requests'] / result['seconds']
+    return result
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage="%prog [options] [scenario ...]",
+        description="Scenarios: " + ", ".join(n for n, f in SCENARIOS))
+    parser.add_option('--nodes', type='int', default=1000,
+                      help="size of the synthetic fleet")
+    parser.add_option('--latency', type='float', default=0.0,
+                      help="seconds the server waits before each response")
+    parser.add_option('--repeat', type='int', default=5,
+                      help="iterations of the read scenarios")
+    parser.add_option('--workers', type='int', default=8,
+                      help="max_workers for tag_many and metric fetches")
+    parser.add_option('--points', type='int', default=288,
+                      help="data points per metric response")
+    parser.add_option('--gzip', action='store_true', default=False,
+                      help="have the server gzip responses")
+    parser.add_option('--identity', action='store_true', default=False,
+                      help="don't ask for compressed responses")
+    parser.add_option('-o', '--output', help="write JSON here, not stdout")
+    options, names = parser.parse_args(argv)
+
+    scenarios = dict(SCENARIOS)
+    for name in names:
+        if name not in scenarios:
+            parser.error("unknown scenario %r" % name)
+    names = names or [n for n, f in SCENARIOS]
+
+    server = MockServer(Fleet(options.nodes, points=options.points),
+                        options.latency, compress=options.gzip).start()
+    results = {'config': {'nodes': options.nodes, 'latency': options.latency,
+                          'repeat': options.repeat, 'workers': options.workers,
+                          'points': options.points, 'gzip': options.gzip,
+                          'identity': options.identity,
+                          'python': sys.version.split()[0]},
+               'scenarios': {}}
+    for name in names:
+        results['scenarios'][name] = run_scenario(server, scenarios[name],
+                                                  options)
+        sys.stderr.write("%-16s %s\n" % (name, _summary(
+            results['scenarios'][name])))
+    server.shutdown()
+
+    out = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        fp = open(options.output, 'w')
+        try:
+            fp.write(out + "\n")
+        finally:
+            fp.close()
+    else:
+        print out
+
+
+def _summary(result):
+    if 'error' in result:
+        return "failed: %s" % result['error']
+    return "%7.3fs %5d requests %8.0f req/s %8d KB" % (
+        result['seconds'], result['requests'],
+        result['requests_per_second'], result['peak_rss_kb'])
+
+
+if __name__ == "__main__":
+    main()
@@ -14,8 +14,46 @@
 # limitations under the License.
 
 
-__all__ = ["__version__", "Connection"]
+__all__ = ["__version__", "Connection", "AsyncConnection"]
 __version__ = "0.2.0-dev"
 
-from cloudkick_api.base import Connection
-from cloudkick_api import fabhelper as fab
+import sys
+import types
+
+# Names importable from the package, and the modules they come from.
+# Nothing is imported until one of them is first used, so importing the
+# package (e.g. from a fabfile) doesn't pull in oauth, httplib and the
+# endpoint modules.
+_LAZY = {
+    'Connection': ('cloudkick_api.base', 'Connection'),
+    'AsyncConnection': ('cloudkick_api.base', 'AsyncConnection'),
+    'fab': ('cloudkick_api.fabhelper', None),
+}
+
+
+class _LazyModule(types.ModuleType):
+    """Package module that imports the names in _LAZY on first access"""
+
+    def __getattr__(self, name):
+        try:
+            module, attr = _LAZY[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute %r" % name)
+        __import__(module)
+        value = sys.modules[module]
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_LAZY))
+
+
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(dict((k, v) for k, v in globals().iteritems()
+                             if k not in ('_module', '__builtins__')))
+# Keep the original module alive; Python 2 clears a module's globals when
+# it is collected, and the functions above still refer to them.
+_module._original = sys.modules[__name__]
+sys.modules[__name__] = _module
@@ -14,11 +14,15 @@
 # limitations under the License.
 
 
-__all__ = ["Connection"]
+__all__ = ["Connection", "AsyncConnection"]
 
+import httplib
 import os
+import socket
+import threading
+import time
 import urllib
-from oauth import oauth
+import urlparse
 
 try:
     import json
@@ -26,6 +30,45 @@ except ImportError:
     import simplejson as json
 
 import endpoints
+import stream
+from pool import ConnectionPool
+from futures import Executor
+from cache import LRUCache, ResponseCache, request_key
+from singleflight import SingleFlight
+from signing import SigningContext
+from scheduler import RequestScheduler
+from instrument import RequestTiming
+from compress import ACCEPT_ENCODING, decompressing
+
+
+class _UrllibResponse(object):
+    """
+    Gives urllib responses the interface of pooled responses
+    """
+
+    def __init__(self, f, timing=None):
+        self._f = f
+        self._timing = timing
+        self.status = f.getcode()
+
+    def getheader(self, name, default=None):
+        return self._f.info().getheader(name, default)
+
+    def read(self, amt=None):
+        timing = self._timing
+        if timing is not None:
+            start = time.time()
+        if amt is None:
+            data = self._f.read()
+        else:
+            data = self._f.read(amt)
+        if timing is not None:
+            timing.phases['read'] += time.time() - start
+            timing.bytes_in += len(data)
+        return data
+
+    def close(self):
+        self._f.close()
 
 
 class Connection(object):
@@ -34,15 +77,46 @@ class Connection(object):
 
     Provides an interface to the Cloudkick API over an HTTPS connection,
     using OAuth to authenticate requests.
+
+    Requests are sent over a pool of keep-alive connections by default;
+    pass keep_alive=False to open a new connection for every request, or
+    pool to share a ConnectionPool between several Connection objects.
+    Either way the http_proxy, https_proxy and no_proxy environment
+    variables are honoured; see ConnectionPool to set proxies explicitly.
+
+    Pass cache=True (or a ResponseCache) to cache the responses of rarely
+    changing read-only endpoints such as check_types and tags.
+
+    With conditional=True, GETs are sent as conditional requests using
+    the validators of the previous response to the same request, so
+    unchanged data is not downloaded again.
+
+    With single_flight=True, identical GETs issued concurrently from
+    several threads share one request and all receive its decoded result.
+
+    Pass scheduler=True (or a RequestScheduler) to retry throttled and
+    failed requests with backoff and, optionally, to rate limit them.
+
+    Hooks added with add_hook() are called with a RequestTiming after
+    every API call; see cloudkick_api.instrument.
+
+    Responses are requested gzip or deflate compressed and inflated as
+    they are read; pass compress=False to ask for identity encoding.
     """
 
     API_SERVER = "api.cloudkick.com"
     API_VERSION = "2.0"
 
     def __init__(self, config_path=None, oauth_key=None, oauth_secret=None,
-                 api_server=API_SERVER, api_version=API_VERSION, prefer_params=False):
-        self.__oauth_key = oauth_key or None
-        self.__oauth_secret = oauth_secret or None
+                 api_server=API_SERVER, api_version=API_VERSION, prefer_params=False,
+                 keep_alive=True, pool=None, cache=None, conditional=False,
+                 single_flight=False, scheduler=None, hooks=None,
+                 compress=True):
+        self.__params = (oauth_key or None, oauth_secret or None)
+        self.__oauth_key, self.__oauth_secret = self.__params
+        self.__config_loaded = False
+        self.__signing = None
+        self.__base_urls = {}
         self.__prefer_params = prefer_params
         self.__api_server = api_server
         self.__api_version = api_version
@@ -53,6 +127,26 @@ class Connection(object):
         if not isinstance(config_path, list):
             config_path = [config_path]
         self.config_path = config_path
+        if not keep_alive:
+            pool = None
+        elif pool is None:
+            pool = ConnectionPool()
+        self.__pool = pool
+        if cache is True:
+            cache = ResponseCache()
+        self.__cache = cache or None
+        self.__conditional = conditional
+        self.__validators = LRUCache(256)
+        if single_flight:
+            self.__flights = SingleFlight()
+        else:
+            self.__flights = None
+        if scheduler is True:
+            scheduler = RequestScheduler()
+        self.__scheduler = scheduler or None
+        self.__hooks = list(hooks or [])
+        self.__local = threading.local()
+        self.__compress = compress
 
     def _read_config(self):
         errors = []
@@ -85,16 +179,28 @@ class Connection(object):
                 if not self.__prefer_params or self.__oauth_secret is None:
                     self.__oauth_secret = value
 
+    def _load_config(self):
+        if not self.__config_loaded:
+            self._read_config()
+            self.__config_loaded = True
+
+    def reload_config(self):
+        """Discard credentials read from the config files, so they are
+           read again on the next request"""
+        self.__oauth_key, self.__oauth_secret = self.__params
+        self.__config_loaded = False
+        self.__signing = None
+
     @property
     def oauth_key(self):
         if not self.__oauth_key:
-            self._read_config()
+            self._load_config()
         return self.__oauth_key
 
     @property
     def oauth_secret(self):
         if not self.__oauth_secret:
-            self._read_config()
+            self._load_config()
         return self.__oauth_secret
 
     @property
@@ -109,96 +215,420 @@ class Connection(object):
         """Filter out any null parameters"""
         return dict((k, v) for k, v in params.iteritems() if v is not None)
 
-    def _request(self, url, parameters=None, method='GET', force_api_version=None):
+    @property
+    def pool(self):
+        return self.__pool
+
+    @property
+    def cache(self):
+        return self.__cache
+
+    def invalidate(self, prefix=None):
+        """Drop cached responses, optionally only for urls under prefix"""
+        if self.__cache is not None:
+            self.__cache.invalidate(prefix)
+
+    def add_hook(self, hook):
+        """Call hook(timing) with a RequestTiming after every API call"""
+        self.__hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.__hooks.remove(hook)
+
+    def close(self):
+        """Close any idle keep-alive connections"""
+        if self.__pool is not None:
+            self.__pool.close()
+
+    def _urlopen(self, method, url, body=None, headers=None):
+        headers = dict(headers or {})
+        timing = None
+        if self.__hooks:
+            timing = getattr(self.__local, 'timing', None)
+        if self.__pool is None:
+            if timing is not None:
+                start = time.time()
+            if not headers:
+                f = urllib.urlopen(url, body)
+            else:
+                opener = urllib.FancyURLopener()
+                for name, value in headers.iteritems():
+                    opener.addheader(name, value)
+                f = opener.open(url, body)
+            if timing is not None:
+                timing.phases['server'] += time.time() - start
+                timing.bytes_out += len(url) + len(body or '')
+                timing.status = f.getcode()
+            return _UrllibResponse(f, timing)
+        parts = urlparse.urlsplit(url)
+        path = parts.path
+        if parts.query:
+            path = "%s?%s" % (path, parts.query)
+        if body is not None:
+            headers['Content-Type'] = "application/x-www-form-urlencoded"
+        return self.__pool.request(parts.scheme, parts.hostname, parts.port,
+                                   method, path, body, headers, timing)
+
+    def _open(self, url, parameters=None, method='GET', force_api_version=None,
+              headers=None):
+        """Sign and send a request, returning the unread response"""
         if not parameters:
             parameters = None
         else:
             parameters = self._filter_params(parameters)
 
-        signature_method = oauth.OAuthSignatureMethod_HMAC_SHA1()
-        consumer = oauth.OAuthConsumer(self.oauth_key, self.oauth_secret)
-        if self.api_server[:3] == "127":
-            protocol = "http://"
-        else:
-            protocol = "https://"
-        if force_api_version:
-            api_version = force_api_version
-        else:
-            api_version = self.api_version
-        url = '%s%s/%s/%s' % (protocol, self.api_server, api_version, url)
-        oauth_request = oauth.OAuthRequest.from_consumer_and_token(consumer,
-                                                                   http_url=url,
-                                                                   http_method=method,
-                                                                   parameters=parameters)
-        oauth_request.sign_request(signature_method, consumer, None)
+        scheduler = self.__scheduler
+        if scheduler is None:
+            return self._send(url, parameters, method, force_api_version,
+                              headers)
+
+        priority = scheduler.priority(method, url)
+        attempt = 0
+        while True:
+            scheduler.acquire(priority)
+            try:
+                f = self._send(url, parameters, method, force_api_version,
+                               headers)
+            except (IOError, socket.error, httplib.HTTPException):
+                if method != 'GET' or attempt >= scheduler.max_retries:
+                    raise
+                time.sleep(scheduler.delay(attempt))
+                attempt += 1
+                continue
+            if not scheduler.should_retry(method, f.status, attempt):
+                return f
+            wait = scheduler.delay(attempt, f.getheader('Retry-After'))
+            if wait is None:
+                return f
+            f.read()
+            f.close()
+            time.sleep(wait)
+            attempt += 1
+
+    def _send(self, url, parameters, method, force_api_version, headers):
+        # Signed per attempt, so retries get a fresh nonce and timestamp.
+        oauth_request = self._sign(url, method, parameters, force_api_version)
+        if self.__compress:
+            headers = dict(headers or {})
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
         if method == "GET":
             url = oauth_request.to_url()
-            f = urllib.urlopen(url)
+            f = self._urlopen(method, url, headers=headers)
         else:
             url = oauth_request.get_normalized_http_url()
-            f = urllib.urlopen(url, oauth_request.to_postdata())
+            f = self._urlopen(method, url, oauth_request.to_postdata(), headers)
+        if self.__compress:
+            f = decompressing(f)
+        return f
+
+    def _base_url(self, api_version):
+        base_url = self.__base_urls.get(api_version)
+        if base_url is None:
+            if self.api_server[:3] == "127":
+                protocol = "http://"
+            else:
+                protocol = "https://"
+            base_url = '%s%s/%s/' % (protocol, self.api_server, api_version)
+            self.__base_urls[api_version] = base_url
+        return base_url
+
+    def _sign(self, url, method='GET', parameters=None, force_api_version=None):
+        """Return a signed OAuthRequest for url"""
+        signing = self.__signing
+        if signing is None:
+            signing = SigningContext(self.oauth_key, self.oauth_secret)
+            self.__signing = signing
+        url = self._base_url(force_api_version or self.api_version) + url
+        return signing.sign(url, method, parameters)
+
+    def _request(self, *args, **kwargs):
+        f = self._open(*args, **kwargs)
         s = f.read()
         return s
 
-    def _request_json(self, *args, **kwargs):
-        r = self._request(*args, **kwargs)
+    def _request_raw(self, url, parameters=None, method='GET',
+                     force_api_version=None, endpoint=None):
+        """Like _request_json, but return the undecoded response body"""
+        if not self.__hooks:
+            return self._request(url, parameters, method, force_api_version)
+        timing = RequestTiming(endpoint, method, url)
+        self.__local.timing = timing
+        try:
+            try:
+                return self._request(url, parameters, method,
+                                     force_api_version)
+            except Exception, e:
+                timing.error = e
+                raise
+        finally:
+            self.__local.timing = None
+            self._emit(timing)
+
+    def _request_json(self, url, parameters=None, method='GET', force_api_version=None,
+                      endpoint=None):
+        return self._request_json_changed(url, parameters, method,
+                                          force_api_version,
+                                          self.__conditional, endpoint)[0]
+
+    def _request_json_changed(self, url, parameters=None, method='GET',
+                              force_api_version=None, conditional=True,
+                              endpoint=None):
+        """Like _request_json, but return a (data, changed) tuple
+
+        With conditional set, GETs send the ETag/Last-Modified validators
+        of the previous response for the same request; when the server
+        answers 304 Not Modified the previously decoded data is returned
+        with changed set to False.
+        """
+        if not self.__hooks:
+            return self._request_json_timed(url, parameters, method,
+                                            force_api_version, conditional)
+        timing = RequestTiming(endpoint, method, url)
+        self.__local.timing = timing
+        try:
+            try:
+                return self._request_json_timed(url, parameters, method,
+                                                force_api_version, conditional)
+            except Exception, e:
+                timing.error = e
+                raise
+        finally:
+            self.__local.timing = None
+            self._emit(timing)
+
+    def _emit(self, timing):
+        timing.total = time.time() - timing.started
+        for hook in self.__hooks:
+            hook(timing)
+
+    def _request_json_timed(self, url, parameters, method, force_api_version,
+                            conditional):
+        cache = self.__cache
+        if method != 'GET':
+            try:
+                return self._fetch_json(url, parameters, method,
+                                        force_api_version), True
+            finally:
+                if cache is not None:
+                    cache.invalidate_related(url)
+
+        key = request_key(method, force_api_version or self.api_version, url,
+                          self._filter_params(parameters or {}))
+        ttl = 0
+        if cache is not None:
+            ttl = cache.ttl_for(url)
+        if ttl > 0:
+            hit, value = cache.get(key)
+            if hit:
+                if self.__hooks:
+                    self.__local.timing.cache_hit = True
+                return value, False
+        if self.__flights is None:
+            value, changed = self._fetch_json_get(key, url, parameters,
+                                                  force_api_version, conditional)
+        else:
+            value, changed = self.__flights.do((key, conditional),
+                                               self._fetch_json_get, key, url,
+                                               parameters, force_api_version,
+                                               conditional)
+        if ttl > 0 and isinstance(value, (dict, list)):
+            cache.set(key, value, ttl)
+        return value, changed
+
+    def _fetch_json_get(self, key, url, parameters, force_api_version,
+                        conditional):
+        if conditional:
+            return self._fetch_json_conditional(key, url, parameters,
+                                                force_api_version)
+        return self._fetch_json(url, parameters, 'GET', force_api_version), True
+
+    def _fetch_json_conditional(self, key, url, parameters, force_api_version):
+        validators = self.__validators.get(key)
+        headers = {}
+        if validators is not None:
+            etag, last_modified, previous = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        f = self._open(url, parameters, 'GET', force_api_version, headers)
+        r = f.read()
+        if f.status == 304 and validators is not None:
+            return previous, False
+
+        value = self._decode_json(r)
+        etag = f.getheader('ETag')
+        last_modified = f.getheader('Last-Modified')
+        if f.status == 200 and (etag or last_modified) and \
+                isinstance(value, (dict, list)):
+            self.__validators.set(key, (etag, last_modified, value))
+        else:
+            self.__validators.pop(key)
+        return value, True
+
+    def _fetch_json(self, *args, **kwargs):
+        return self._decode_json(self._request(*args, **kwargs))
 
+    def _decode_json(self, r):
+        timing = None
+        if self.__hooks:
+            timing = getattr(self.__local, 'timing', None)
+            start = time.time()
         try:
             return json.loads(r)
         except ValueError:
             return r
+        finally:
+            if timing is not None:
+                timing.phases['decode'] += time.time() - start
+
+    def _request_json_iter(self, url, parameters=None, method='GET',
+                           force_api_version=None, key='items', endpoint=None):
+        """Decode the response while it downloads, yielding the elements
+           of its top-level key array (default 'items') one at a time"""
+        timing = None
+        if self.__hooks:
+            timing = RequestTiming(endpoint, method, url)
+            self.__local.timing = timing
+        try:
+            f = self._open(url, parameters, method, force_api_version)
+        except Exception, e:
+            if timing is not None:
+                self.__local.timing = None
+                timing.error = e
+                self._emit(timing)
+            raise
+        if timing is not None:
+            self.__local.timing = None
+        try:
+            try:
+                # An error page would otherwise surface as an opaque
+                # decoding error, losing the server's message.
+                if f.status is not None and f.status >= 400:
+                    raise endpoints.ApiEndPointException(
+                        "HTTP %d response for %s: %r" % (f.status, url,
+                                                         f.read(200)))
+                for item in stream.iter_items(f, key):
+                    yield item
+                # Drain the rest so a keep-alive connection can be reused.
+                f.read()
+            except Exception, e:
+                if timing is not None:
+                    timing.error = e
+                raise
+        finally:
+            f.close()
+            if timing is not None:
+                self._emit(timing)
+
+    def _endpoint(self, cls):
+        return cls(self)
 
     @property
     def addresses(self):
-        return endpoints.Addresses(self)
+        return self._endpoint(endpoints.Addresses)
 
     @property
     def address_types(self):
-        return endpoints.AddressTypes(self)
+        return self._endpoint(endpoints.AddressTypes)
 
     @property
     def changelogs(self):
-        return endpoints.ChangeLogs(self)
+        return self._endpoint(endpoints.ChangeLogs)
 
     @property
     def checks(self):
-        return endpoints.Checks(self)
+        return self._endpoint(endpoints.Checks)
 
     @property
     def check_types(self):
-        return endpoints.CheckTypes(self)
+        return self._endpoint(endpoints.CheckTypes)
 
     @property
     def interesting_metrics(self):
-        return endpoints.InterestingMetrics(self)
+        return self._endpoint(endpoints.InterestingMetrics)
 
     @property
     def monitors(self):
-        return endpoints.Monitors(self)
+        return self._endpoint(endpoints.Monitors)
 
     @property
     def nodes(self):
-        return endpoints.Nodes(self)
+        return self._endpoint(endpoints.Nodes)
 
     @property
     def providers(self):
-        return endpoints.Providers(self)
+        return self._endpoint(endpoints.Providers)
 
     @property
     def provider_types(self):
-        return endpoints.ProviderTypes(self)
+        return self._endpoint(endpoints.ProviderTypes)
 
     @property
     def monitoring_servers(self):
-        return endpoints.MonitoringServers(self)
+        return self._endpoint(endpoints.MonitoringServers)
 
     @property
     def status_nodes(self):
-        return endpoints.StatusNodes(self)
+        return self._endpoint(endpoints.StatusNodes)
 
     @property
     def tags(self):
-        return endpoints.Tags(self)
+        return self._endpoint(endpoints.Tags)
+
+
+class _AsyncEndpoint(object):
+    """
+    Proxy that runs the public methods of an endpoint on an Executor
+    """
+
+    def __init__(self, endpoint, executor):
+        self._endpoint = endpoint
+        self._executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self._endpoint, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        def submit(*args, **kwargs):
+            return self._executor.submit(attr, *args, **kwargs)
+        submit.__name__ = name
+        submit.__doc__ = attr.__doc__
+        return submit
+
+
+class AsyncConnection(Connection):
+    """
+    Cloudkick API Connection returning futures
+
+    Exposes the same endpoints as Connection, but every endpoint method
+    returns a cloudkick_api.futures.Future immediately and the request
+    runs on a pool of at most max_concurrency worker threads. Config
+    loading and OAuth signing are shared with Connection.
+
+        conn = AsyncConnection(max_concurrency=50)
+        pending = [conn.nodes.metric_data(nid, "cpu") for nid in node_ids]
+        results = [f.result() for f in pending]
+    """
+
+    def __init__(self, *args, **kwargs):
+        max_concurrency = kwargs.pop('max_concurrency', 10)
+        if kwargs.get('keep_alive', True) and kwargs.get('pool') is None:
+            kwargs['pool'] = ConnectionPool(maxsize=max_concurrency)
+        Connection.__init__(self, *args, **kwargs)
+        self.__executor = Executor(max_concurrency)
+
+    @property
+    def max_concurrency(self):
+        return self.__executor.max_workers
+
+    def _endpoint(self, cls):
+        return _AsyncEndpoint(cls(self), self.__executor)
+
+    def close(self):
+        """Stop the worker threads and close idle connections"""
+        self.__executor.shutdown()
+        Connection.close(self)
 
 
 if __name__ == "__main__":
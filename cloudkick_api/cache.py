@@ -0,0 +1,224 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["LRUCache", "ResponseCache", "request_key"]
+
+import threading
+import time
+
+# Seconds to cache GET responses for, by endpoint. Endpoints not listed
+# here are not cached unless a ttl is configured for them.
+DEFAULT_TTLS = {
+    'address_types': 3600,
+    'check_types': 3600,
+    'provider_types': 3600,
+    'providers': 600,
+    'tags': 300,
+}
+
+# Cached endpoints to invalidate after a POST to an endpoint.
+INVALIDATES = {
+    'nodes': ['nodes', 'tags', 'checks', 'status/nodes'],
+    'node': ['nodes', 'status/nodes'],
+    'monitors': ['monitors', 'checks', 'status/nodes'],
+}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def request_key(method, api_version, url, parameters):
+    """Build a hashable key identifying a request, ignoring signing"""
+    if parameters:
+        parameters = _freeze(parameters)
+    else:
+        parameters = ()
+    return (method, api_version, url, parameters)
+
+
+def _matches(url, prefix):
+    return url == prefix or url.startswith(prefix + '/')
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping holding at most maxsize entries, evicting the
+    least recently used one first
+    """
+
+    def __init__(self, maxsize=256):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            # Circular doubly linked list of [prev, next, key, value],
+            # most recently used at the end.
+            self._root = root = []
+            root[:] = [root, root, None, None]
+            self._map = {}
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def keys(self):
+        self._lock.acquire()
+        try:
+            return self._map.keys()
+        finally:
+            self._lock.release()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is None:
+                return default
+            prev, next = link[0], link[1]
+            prev[1] = next
+            next[0] = prev
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            link = self._map.pop(key, None)
+            if link is not None:
+                link[0][1] = link[1]
+                link[1][0] = link[0]
+            elif len(self._map) >= self.maxsize:
+                oldest = self._root[1]
+                oldest[0][1] = oldest[1]
+                oldest[1][0] = oldest[0]
+                del self._map[oldest[2]]
+            root = self._root
+            last = root[0]
+            link = [last, root, key, value]
+            last[1] = root[0] = self._map[key] = link
+        finally:
+            self._lock.release()
+
+    def pop(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._map.pop(key, None)
+            if link is None:
+                return default
+            link[0][1] = link[1]
+            link[1][0] = link[0]
+            return link[3]
+        finally:
+            self._lock.release()
+
+
+class ResponseCache(object):
+    """
+    TTL and LRU bounded cache of decoded API responses
+
+    ttls maps endpoint urls (e.g. 'tags' or 'nodes') to the number of
+    seconds their GET responses stay fresh, overriding DEFAULT_TTLS; a
+    url matches its longest listed prefix. Endpoints without a ttl use
+    default_ttl, which by default disables caching for them.
+
+    Cached objects are shared between callers and must not be modified.
+    """
+
+    def __init__(self, maxsize=256, ttls=None, default_ttl=0):
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        self._lock.acquire()
+        try:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self._lock.release()
+
+    def ttl_for(self, url):
+        best = None
+        for prefix in self.ttls:
+            if _matches(url, prefix) and (best is None or
+                                          len(prefix) > len(best)):
+                best = prefix
+        if best is None:
+            return self.default_ttl
+        return self.ttls[best]
+
+    def get(self, key):
+        """Return (True, value) for a fresh entry, else (False, None)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.time():
+                self._count(True)
+                return True, value
+            self._entries.pop(key)
+        self._count(False)
+        return False, None
+
+    def set(self, key, value, ttl):
+        self._entries.set(key, (time.time() + ttl, value))
+
+    def invalidate(self, prefix=None):
+        """Drop every entry, or only those for urls under prefix"""
+        if prefix is None:
+            self._entries.clear()
+            return
+        for key in self._entries.keys():
+            if _matches(key[2], prefix):
+                self._entries.pop(key)
+
+    def invalidate_related(self, url):
+        """Drop the entries a POST to url may have made stale"""
+        endpoint = url.split('/', 1)[0]
+        for prefix in INVALIDATES.get(endpoint, [endpoint]):
+            self.invalidate(prefix)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self._entries.maxsize}
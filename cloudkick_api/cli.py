@@ -0,0 +1,307 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+cloudkick command line tool
+
+    cloudkick [options] nodes [--query Q]
+    cloudkick [options] checks [--node-ids IDS] [--monitor-id ID]
+    cloudkick [options] status [--statuses S] [--query Q]
+    cloudkick [options] metrics CHECK (--query Q | NODE_ID ... | -)
+
+Records are written as they arrive, one JSON object per line by
+default, so output can be piped into other tools while the listing is
+still downloading. metrics fetches --parallel nodes at a time and reads
+node ids from stdin when given '-':
+
+    cloudkick nodes -q tag:web -f id -o tsv | cloudkick metrics -p 32 ping -
+"""
+
+__all__ = ["main"]
+
+import errno
+import httplib
+import optparse
+import signal
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+COMMANDS = ('nodes', 'checks', 'status', 'metrics')
+
+USAGE = """%prog [options] COMMAND [command options]
+
+Commands:
+  nodes     list nodes
+  checks    list checks
+  status    list check statuses
+  metrics   fetch metric data of a check for many nodes
+
+Run %prog COMMAND --help for the options of a command."""
+
+
+class _Writer(object):
+    """Writes records to a stream as ndjson, a JSON array or tsv"""
+
+    def __init__(self, fp, format, fields=None):
+        self.fp = fp
+        self.format = format
+        self.fields = fields
+        self.count = 0
+
+    def _select(self, record):
+        if not self.fields:
+            return record
+        return dict((f, record.get(f)) for f in self.fields)
+
+    def write(self, record):
+        record = self._select(record)
+        if self.format == 'tsv':
+            values = [record.get(f) for f in self.fields or sorted(record)]
+            line = "\t".join(_tsv(v) for v in values)
+        else:
+            line = json.dumps(record, sort_keys=True)
+        if self.format == 'json':
+            line = (self.count and ",\n " or "[") + line
+        else:
+            line += "\n"
+        self.fp.write(line)
+        # Flush per record so consumers see data as it arrives.
+        if self.format != 'json':
+            self.fp.flush()
+        self.count += 1
+
+    def close(self):
+        if self.format == 'json':
+            self.fp.write(self.count and "]\n" or "[]\n")
+        self.fp.flush()
+
+
+def _tsv(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _cached(options, conn, key, fetch):
+    """Yield the items of fetch(), reusing a copy from the disk cache
+       when --cache is set"""
+    if not options.cache:
+        for item in fetch():
+            yield item
+        return
+    from cloudkick_api.diskcache import DiskCache
+    cache = DiskCache(options.cache_path, options.cache_ttl)
+    key = "%s:cli:%s" % (conn.oauth_key, key)
+    items = cache.get(key)
+    if items is not None:
+        for item in items:
+            yield item
+        return
+    items = []
+    for item in fetch():
+        items.append(item)
+        yield item
+    cache.set(key, items)
+
+
+def cmd_nodes(conn, options, args):
+    params = (options.query, options.active)
+    return _cached(options, conn, "nodes:%r" % (params,),
+                   lambda: conn.nodes.iter(query=options.query,
+                                           is_active=options.active,
+                                           page_size=options.page_size))
+
+
+def cmd_checks(conn, options, args):
+    params = (options.node_ids, options.monitor_id)
+    return _cached(options, conn, "checks:%r" % (params,),
+                   lambda: conn.checks.iter(node_ids=options.node_ids,
+                                            monitor_id=options.monitor_id,
+                                            page_size=options.page_size))
+
+
+def cmd_status(conn, options, args):
+    params = (options.statuses, options.query)
+    return _cached(options, conn, "status:%r" % (params,),
+                   lambda: conn.status_nodes.iter(
+                       overall_check_statuses=options.statuses,
+                       query=options.query))
+
+
+def _node_ids(conn, options, args):
+    if args == ['-']:
+        # readline rather than iterating over the file, whose read-ahead
+        # buffer would hold ids back until it fills.
+        for line in iter(sys.stdin.readline, ''):
+            line = line.strip()
+            if line:
+                yield line.split()[0]
+    elif args:
+        for node_id in args:
+            yield node_id
+    else:
+        for node in cmd_nodes(conn, options, []):
+            yield node['id']
+
+
+def cmd_metrics(conn, options, args):
+    if not args:
+        raise optparse.OptParseError("metrics needs a check name")
+    name, args = args[0], args[1:]
+    if not args and not options.query:
+        raise optparse.OptParseError("give node ids, '-' or --query")
+    if options.custom:
+        fetch = conn.nodes.custom_metric_data_many
+    else:
+        fetch = conn.nodes.metric_data_many
+    # Ids are read as the fetches need them, so a slow producer piping
+    # into '-' gets results while it is still writing.
+    node_ids = _node_ids(conn, options, args)
+    for node_id, result in fetch(node_ids, name, options.parallel):
+        if isinstance(result, Exception):
+            yield {'node_id': node_id, 'error': str(result)}
+        elif not isinstance(result, dict):
+            # An error page the client couldn't decode as JSON.
+            yield {'node_id': node_id,
+                   'error': "unexpected response: %r" % (result[:200],)}
+        elif options.summary:
+            from cloudkick_api.metrics import MetricSeries
+            try:
+                summary = MetricSeries.from_response(result).summary()
+            except (KeyError, IndexError, TypeError, ValueError), e:
+                yield {'node_id': node_id, 'error': str(e)}
+            else:
+                summary['node_id'] = node_id
+                yield summary
+        else:
+            yield {'node_id': node_id, 'data': result}
+
+
+def _parser(command):
+    parser = optparse.OptionParser(usage=USAGE)
+    parser.disable_interspersed_args()
+    group = optparse.OptionGroup(parser, "General options")
+    group.add_option('-c', '--config', help="path to cloudkick.conf")
+    group.add_option('--api-server', default=None,
+                     help="API host, for testing")
+    group.add_option('-o', '--output', choices=['ndjson', 'json', 'tsv'],
+                     default='ndjson',
+                     help="ndjson (default), json or tsv")
+    group.add_option('-f', '--fields',
+                     help="comma-separated fields to output")
+    group.add_option('--cache', action='store_true', default=False,
+                     help="reuse listings cached on disk by earlier runs")
+    group.add_option('--cache-ttl', type='int', default=300,
+                     help="seconds --cache results stay valid [%default]")
+    group.add_option('--cache-path', help="cache file (default under "
+                     "~/.cache/cloudkick)")
+    parser.add_option_group(group)
+    if command is None:
+        return parser
+
+    parser.set_usage("%%prog [options] %s [command options]" % command)
+    parser.enable_interspersed_args()
+    group = optparse.OptionGroup(parser, "%s options" % command)
+    if command in ('nodes', 'status', 'metrics'):
+        group.add_option('-q', '--query', default=None,
+                         help="Cloudkick query selecting the nodes")
+    if command in ('nodes', 'metrics'):
+        group.add_option('--active', default=None,
+                         help="only nodes with is_active set to this")
+    if command in ('nodes', 'checks', 'metrics'):
+        group.add_option('--page-size', type='int', default=100,
+                         help="items per request [%default]")
+    if command == 'checks':
+        group.add_option('--node-ids', help="comma-separated node ids")
+        group.add_option('--monitor-id')
+    if command == 'status':
+        group.add_option('-s', '--statuses',
+                         help="only these overall statuses, e.g. "
+                         "Error,Warning")
+    if command == 'metrics':
+        group.add_option('-p', '--parallel', type='int', default=8,
+                         help="requests to run at once [%default]")
+        group.add_option('--custom', action='store_true', default=False,
+                         help="CHECK names a custom plugin")
+        group.add_option('--summary', action='store_true', default=False,
+                         help="output count, min, max, mean and p95 "
+                         "instead of the points")
+    parser.add_option_group(group)
+    return parser
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # Die quietly when the reader goes away, e.g. piping into head.
+    if hasattr(signal, 'SIGPIPE'):
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    # Parse the general options first to find the command, then again
+    # with the command's options added.
+    options, args = _parser(None).parse_args(argv)
+    if not args or args[0] not in COMMANDS:
+        _parser(None).error("expected one of: %s" % ", ".join(COMMANDS))
+    command = args[0]
+    parser = _parser(command)
+    i = len(argv) - len(args)
+    options, args = parser.parse_args(argv[:i] + argv[i + 1:])
+
+    from cloudkick_api.base import Connection
+    from cloudkick_api.endpoints import ApiEndPointException
+    from cloudkick_api.pool import ConnectionPool
+    kwargs = {'config_path': options.config,
+              'pool': ConnectionPool(maxsize=max(getattr(options, 'parallel',
+                                                         1), 10))}
+    if options.api_server:
+        kwargs['api_server'] = options.api_server
+    conn = Connection(**kwargs)
+
+    fields = None
+    if options.fields:
+        fields = [f.strip() for f in options.fields.split(',') if f.strip()]
+    if options.output == 'tsv' and not fields and command != 'metrics':
+        fields = ['id']
+    writer = _Writer(sys.stdout, options.output, fields)
+    try:
+        try:
+            for record in globals()['cmd_' + command](conn, options, args):
+                writer.write(record)
+        finally:
+            writer.close()
+            conn.close()
+    except optparse.OptParseError, e:
+        parser.error(e.msg)
+    except IOError, e:
+        if e.errno == errno.EPIPE:
+            return 0
+        sys.stderr.write("cloudkick: %s\n" % e)
+        return 1
+    except (ApiEndPointException, ValueError, httplib.HTTPException), e:
+        sys.stderr.write("cloudkick: %s\n" % e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
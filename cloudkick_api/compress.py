@@ -0,0 +1,96 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["ACCEPT_ENCODING", "DecompressingResponse", "decompressing"]
+
+import zlib
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+# Compressed bytes read from the wire at a time.
+CHUNK_SIZE = 16384
+
+
+class DecompressingResponse(object):
+    """
+    Response wrapper that inflates a gzip or deflate encoded body as it
+    is read
+
+    read(amt) returns at most amt decompressed bytes and only returns ''
+    at the end of the body, so the wrapper can be handed to
+    stream.iter_items like an uncompressed response.
+    """
+
+    def __init__(self, response, encoding):
+        self._response = response
+        self.status = response.status
+        self._encoding = encoding
+        if encoding == 'gzip':
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._zlib = zlib.decompressobj(zlib.MAX_WBITS)
+        # Some servers send raw deflate data without the zlib header;
+        # that can only be told from the first bytes.
+        self._sniff = encoding == 'deflate'
+        self._pending = ''
+        self._eof = False
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def _inflate(self, data, amt):
+        if self._sniff:
+            self._sniff = False
+            try:
+                return self._zlib.decompress(data, amt)
+            except zlib.error:
+                self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._zlib.decompress(data, amt)
+
+    def read(self, amt=None):
+        if amt is None:
+            chunks = []
+            while True:
+                chunk = self.read(CHUNK_SIZE * 4)
+                if not chunk:
+                    return ''.join(chunks)
+                chunks.append(chunk)
+        while True:
+            # Input left over from a previous call whose output hit amt.
+            data = self._pending
+            if not data and not self._eof:
+                data = self._response.read(CHUNK_SIZE)
+                if not data:
+                    self._eof = True
+            if self._eof and not data:
+                return self._zlib.flush()
+            out = self._inflate(data, amt)
+            self._pending = self._zlib.unconsumed_tail
+            if out:
+                return out
+
+    def close(self):
+        self._response.close()
+
+
+def decompressing(response):
+    """Wrap response in a DecompressingResponse if its body is encoded"""
+    encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return DecompressingResponse(response, 'gzip')
+    if encoding == 'deflate':
+        return DecompressingResponse(response, 'deflate')
+    return response
@@ -0,0 +1,124 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["DiskCache"]
+
+import os
+import sqlite3
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), ".cache", "cloudkick",
+                            "cache.sqlite")
+
+
+class DiskCache(object):
+    """
+    TTL cache of JSON values in a SQLite file shared between processes
+
+    get_or_set() holds an exclusive file lock while computing a missing
+    value, so concurrent processes asking for the same key wait for the
+    first one instead of all computing it.
+    """
+
+    def __init__(self, path=None, ttl=300):
+        self.path = path or DEFAULT_PATH
+        self.ttl = ttl
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+        self._db = None
+
+    def _conn(self):
+        if self._db is None or self._db[0] != os.getpid():
+            # SQLite connections must not be shared across fork().
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("CREATE TABLE IF NOT EXISTS cache "
+                       "(key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            db.commit()
+            self._db = (os.getpid(), db)
+        return self._db[1]
+
+    def get(self, key, default=None):
+        db = self._conn()
+        row = db.execute("SELECT expires, value FROM cache WHERE key = ?",
+                         (key,)).fetchone()
+        if row is None or row[0] <= time.time():
+            return default
+        return json.loads(row[1])
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        db = self._conn()
+        db.execute("INSERT OR REPLACE INTO cache (key, expires, value) "
+                   "VALUES (?, ?, ?)",
+                   (key, time.time() + ttl, json.dumps(value)))
+        db.commit()
+
+    def delete(self, key):
+        db = self._conn()
+        db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        db.commit()
+
+    def purge(self):
+        """Delete expired entries"""
+        db = self._conn()
+        db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        db.commit()
+
+    def get_or_set(self, key, fn, ttl=None):
+        """Return the cached value for key, calling fn() to fill it in
+           (once across all processes) when it is missing or expired"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        lock = self._lock()
+        try:
+            value = self.get(key, missing)
+            if value is missing:
+                value = fn()
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self._unlock(lock)
+
+    def _lock(self):
+        if fcntl is None:
+            return None
+        fp = open(self.path + ".lock", 'a')
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        return fp
+
+    def _unlock(self, fp):
+        if fp is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            fp.close()
@@ -0,0 +1,88 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Downsampling of (x, y) series for charting
+
+Both functions run in O(n) and return the sorted indices of the points
+to keep, so the same selection can be applied to several columns.
+"""
+
+__all__ = ["lttb", "minmax"]
+
+
+def lttb(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets: pick threshold points that keep
+       the visual shape of the series"""
+    n = len(xs)
+    if threshold >= n or threshold <= 0:
+        return range(n)
+    if threshold < 3:
+        return [0, n - 1][:threshold]
+
+    every = (n - 2) / float(threshold - 2)
+    keep = [0]
+    a = 0
+    for i in xrange(threshold - 2):
+        # Average of the next bucket, the third corner of the triangle.
+        start = int((i + 1) * every) + 1
+        end = min(int((i + 2) * every) + 1, n)
+        count = end - start
+        avg_x = sum(xs[start:end]) / count
+        avg_y = sum(ys[start:end]) / count
+
+        ax = xs[a]
+        ay = ys[a]
+        best = -1.0
+        chosen = start
+        for j in xrange(int(i * every) + 1, start):
+            area = abs((ax - avg_x) * (ys[j] - ay) -
+                       (ax - xs[j]) * (avg_y - ay))
+            if area > best:
+                best = area
+                chosen = j
+        keep.append(chosen)
+        a = chosen
+    keep.append(n - 1)
+    return keep
+
+
+def minmax(xs, ys, threshold):
+    """Split the series into threshold / 2 buckets and keep the lowest
+       and highest point of each, so spikes are never dropped"""
+    n = len(xs)
+    if threshold >= n or threshold <= 0:
+        return range(n)
+    if threshold < 2:
+        # No room for a pair; keep the single highest point.
+        return [max(xrange(n), key=ys.__getitem__)]
+    buckets = threshold // 2
+    size = n / float(buckets)
+    keep = []
+    for b in xrange(buckets):
+        start = int(b * size)
+        end = min(int((b + 1) * size), n)
+        if start >= end:
+            continue
+        lo = hi = start
+        for j in xrange(start + 1, end):
+            if ys[j] < ys[lo]:
+                lo = j
+            elif ys[j] > ys[hi]:
+                hi = j
+        keep.append(min(lo, hi))
+        if lo != hi:
+            keep.append(max(lo, hi))
+    return keep
@@ -13,6 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import Queue
+
+from futures import Executor
+from metrics import MetricSeries
+from models import Node, Check, Monitor
+
 
 class ApiEndPointException(Exception):
     """Base API exception"""
@@ -27,8 +33,51 @@ class _ApiEndpoint(object):
         self._conn = conn
 
     def _req_json(self, *args, **kwargs):
+        kwargs['endpoint'] = self.__class__.__name__
         return self._conn._request_json(*args, **kwargs)
 
+    def _req_json_changed(self, *args, **kwargs):
+        kwargs['endpoint'] = self.__class__.__name__
+        return self._conn._request_json_changed(*args, **kwargs)
+
+    def _req_json_iter(self, *args, **kwargs):
+        kwargs['endpoint'] = self.__class__.__name__
+        return self._conn._request_json_iter(*args, **kwargs)
+
+    def _req_raw(self, *args, **kwargs):
+        kwargs['endpoint'] = self.__class__.__name__
+        return self._conn._request_raw(*args, **kwargs)
+
+    def _paginate(self, url, params, page_size):
+        """Yield the items of a listing, requesting one page at a time"""
+        if page_size < 1:
+            raise ApiEndPointException("page_size must be at least 1")
+        offset = 0
+        while True:
+            page_params = dict(params)
+            page_params['offset'] = offset
+            page_params['length'] = page_size
+            data = self._req_json(url, page_params)
+            if not isinstance(data, dict):
+                raise ApiEndPointException("Unexpected response for %s: %r" %
+                                           (url, data[:200]))
+            items = data.get('items') or []
+            for item in items:
+                yield item
+            if not items:
+                return
+            offset += len(items)
+            total = data.get('total')
+            # The server may cap pages below page_size, so trust total
+            # when it's given. Without it, stop on a short page, or on a
+            # long one from a server that ignored the paging parameters
+            # and returned everything.
+            if total is not None:
+                if offset >= total:
+                    return
+            elif len(items) != page_size:
+                return
+
 
 class Addresses(_ApiEndpoint):
 
@@ -54,6 +103,15 @@ class ChangeLogs(_ApiEndpoint):
         }
         return self._req_json("change_logs", params)
 
+    def iter(self, startdate=None, enddate=None, page_size=100):
+        """Like read, but lazily yields one change log entry at a time,
+           fetching page_size entries per request"""
+        params = {
+            'startdate': startdate,
+            'enddate': enddate,
+        }
+        return self._paginate("change_logs", params, page_size)
+
 
 class Checks(_ApiEndpoint):
 
@@ -66,6 +124,27 @@ class Checks(_ApiEndpoint):
         }
         return self._req_json("checks", params)
 
+    def iter(self, monitor_id=None, node_ids=None, check_ids=None,
+             page_size=100):
+        """Like read, but lazily yields one check at a time, fetching
+           page_size checks per request"""
+        params = {
+            'monitor_id': monitor_id,
+            'node_ids': node_ids,
+            'check_ids': check_ids
+        }
+        return self._paginate("checks", params, page_size)
+
+    def read_models(self, monitor_id=None, node_ids=None, check_ids=None):
+        """Like read, but return a list of compact Check objects, built
+           while the response downloads"""
+        params = {
+            'monitor_id': monitor_id,
+            'node_ids': node_ids,
+            'check_ids': check_ids
+        }
+        return [Check(c) for c in self._req_json_iter("checks", params)]
+
 
 class CheckTypes(_ApiEndpoint):
 
@@ -107,6 +186,10 @@ class Monitors(_ApiEndpoint):
            as well as the API"""
         return self._req_json("monitors")
 
+    def read_models(self):
+        """Like read, but return a list of compact Monitor objects"""
+        return [Monitor(m) for m in self._req_json_iter("monitors")]
+
 
 class Nodes(_ApiEndpoint):
     """https://support.cloudkick.com/API/2.0/Nodes"""
@@ -148,6 +231,58 @@ class Nodes(_ApiEndpoint):
 
         return self._tag('remove_tag', node_id, tag_id, tag_name, do_create)
 
+    def tag_many(self, node_ids, tag_id=None, tag_name=None, op='add',
+                 do_create=False, max_workers=8):
+        """Add or remove a tag on many nodes concurrently
+
+        Duplicate node ids are only tagged once. When do_create is set the
+        first node is tagged on its own, so the tag is created exactly once
+        before the remaining requests are sent in parallel.
+
+        Returns a dict mapping each node id to the result of its request,
+        or to the exception it raised.
+
+        Keyword arguments
+            node_ids - ids of the nodes to tag
+            tag_id - id of the tag
+            tag_name - name of the tag
+            op - 'add' or 'remove'
+            do_create - create the tag if it doesn't exist (optional)
+            max_workers - number of requests to run at once
+
+        """
+        if op not in ('add', 'remove'):
+            raise ApiEndPointException("op must be 'add' or 'remove'")
+        if tag_id is None and tag_name is None:
+            raise ApiEndPointException("You must pass either a tag_id or a tag_name")
+
+        method = '%s_tag' % op
+        pending = []
+        seen = set()
+        for node_id in node_ids:
+            if node_id not in seen:
+                seen.add(node_id)
+                pending.append(node_id)
+
+        results = {}
+        def run(node_id):
+            try:
+                results[node_id] = self._tag(method, node_id, tag_id,
+                                             tag_name, do_create)
+            except Exception, e:
+                results[node_id] = e
+
+        if do_create and op == 'add' and pending:
+            run(pending.pop(0))
+        executor = Executor(max_workers)
+        try:
+            futures = [executor.submit(run, node_id) for node_id in pending]
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+        return results
+
     def create(self, name, ip_address, details=None):
         """Creates a node on your account with a unique name
 
@@ -179,6 +314,55 @@ class Nodes(_ApiEndpoint):
         }
         return self._req_json("nodes", params)
 
+    def iter(self, query="*", is_active=None, check_id=None, monitor_id=None,
+             provider_id=None, node_ids=None, page_size=100):
+        """Like read, but lazily yields one node at a time, fetching
+           page_size nodes per request so memory use stays bounded"""
+        params = {
+            'query': query,
+            'is_active': is_active,
+            'check_id': check_id,
+            'monitor_id': monitor_id,
+            'provider_id': provider_id,
+            'node_ids': node_ids
+        }
+        return self._paginate("nodes", params, page_size)
+
+    def read_models(self, query="*", is_active=None, check_id=None,
+                    monitor_id=None, provider_id=None, node_ids=None):
+        """Like read, but return a list of compact Node objects, built
+           while the response downloads so the full list of dicts is never
+           held in memory. Nodes support item access and to_dict() for
+           code written against the plain dicts."""
+        params = {
+            'query': query,
+            'is_active': is_active,
+            'check_id': check_id,
+            'monitor_id': monitor_id,
+            'provider_id': provider_id,
+            'node_ids': node_ids
+        }
+        return [Node(n) for n in self._req_json_iter("nodes", params)]
+
+    def poll(self, query="*", is_active=None, check_id=None, monitor_id=None,
+             provider_id=None, node_ids=None):
+        """Like read, but returns a (nodes, changed) tuple
+
+        The request is conditional on the previous response for the same
+        arguments; when nothing has changed the previous result is
+        returned with changed set to False.
+
+        """
+        params = {
+            'query': query,
+            'is_active': is_active,
+            'check_id': check_id,
+            'monitor_id': monitor_id,
+            'provider_id': provider_id,
+            'node_ids': node_ids
+        }
+        return self._req_json_changed("nodes", params)
+
     def update(self, node_id, name=None, ip_address=None,
                  details=None, ssh_user=None, ssh_port=None):
         """Updates node on your account
@@ -204,13 +388,107 @@ class Nodes(_ApiEndpoint):
 
         return self._req_json("node/%s" % node_id, params, 'POST')
 
-    def metric_data(self, node_id, check_name):
-        url = "query/node/%s/check/%s" % (node_id, check_name)
-        return self._req_json(url, force_api_version="1.0")
+    def _metric_url(self, node_id, name, custom):
+        if custom:
+            return "query/node/%s/check/plugin/%s" % (node_id, name)
+        return "query/node/%s/check/%s" % (node_id, name)
+
+    def metric_data(self, node_id, check_name, start=None, end=None):
+        """Return the data points of a node's check, optionally limited
+           to those between the start and end unix timestamps"""
+        url = self._metric_url(node_id, check_name, False)
+        params = {'start': start, 'end': end}
+        return self._req_json(url, params, force_api_version="1.0")
+
+    def custom_metric_data(self, node_id, plugin_name, start=None, end=None):
+        """Return the data points of a node's custom plugin, optionally
+           limited to those between the start and end unix timestamps"""
+        url = self._metric_url(node_id, plugin_name, True)
+        params = {'start': start, 'end': end}
+        return self._req_json(url, params, force_api_version="1.0")
+
+    def _metric_data_raw(self, node_id, name, start=None, end=None,
+                         custom=False):
+        """Like metric_data, or custom_metric_data with custom set, but
+           return the undecoded response body"""
+        url = self._metric_url(node_id, name, custom)
+        params = {'start': start, 'end': end}
+        return self._req_raw(url, params, force_api_version="1.0")
+
+    def metric_series(self, node_id, check_name, metric=None):
+        """Return metric_data decoded into a MetricSeries, using the
+           named metric or the first one in the response"""
+        return MetricSeries.from_response(self.metric_data(node_id, check_name),
+                                          metric)
+
+    def _many(self, fetch, node_ids, name, max_workers):
+        # Only a window of requests is in flight at a time and each is
+        # dropped once yielded, so memory doesn't grow with the number of
+        # nodes and node_ids can be a generator still being produced.
+        executor = Executor(max_workers)
+        window = 2 * max_workers
+        done = Queue.Queue()
+        pending = {}
+        node_ids = iter(node_ids)
+        exhausted = False
+        try:
+            while True:
+                # Hand back whatever has finished before waiting on
+                # node_ids, which may be slow to produce the next id.
+                if exhausted or len(pending) >= window:
+                    if not pending:
+                        break
+                    future = done.get()
+                else:
+                    try:
+                        future = done.get_nowait()
+                    except Queue.Empty:
+                        try:
+                            node_id = node_ids.next()
+                        except StopIteration:
+                            exhausted = True
+                            continue
+                        future = executor.submit(fetch, node_id, name)
+                        pending[future] = node_id
+                        future.add_done_callback(done.put)
+                        continue
+                node_id = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    yield node_id, error
+                else:
+                    yield node_id, future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            # Join the idle workers once everything has finished, so they
+            # don't outlive a short-lived process's interpreter.
+            executor.shutdown(wait=not [f for f in pending if not f.done()])
+
+    def metric_data_many(self, node_ids, check_name, max_workers=8):
+        """Fetch metric_data for many nodes concurrently
+
+        Yields (node_id, result) pairs in the order the requests finish.
+        If a request fails, result is the exception it raised, so one
+        bad node doesn't stop the others. node_ids is consumed lazily, at
+        most 2 * max_workers ahead of the results.
 
-    def custom_metric_data(self, node_id, plugin_name):
-        url = "query/node/%s/check/plugin/%s" % (node_id, plugin_name)
-        return self._req_json(url, force_api_version="1.0")
+        Keyword arguments
+            node_ids - ids of the nodes to fetch
+            check_name - name of the check, as for metric_data
+            max_workers - number of requests to run at once
+
+        """
+        return self._many(self.metric_data, node_ids, check_name, max_workers)
+
+    def custom_metric_data_many(self, node_ids, plugin_name, max_workers=8):
+        """Fetch custom_metric_data for many nodes concurrently
+
+        Works like metric_data_many, yielding (node_id, result) pairs.
+
+        """
+        return self._many(self.custom_metric_data, node_ids, plugin_name,
+                          max_workers)
 
 
 class Providers(_ApiEndpoint):
@@ -241,12 +519,29 @@ class StatusNodes(_ApiEndpoint):
             include_metrics -- Include the metrics with the response
 
         """
+        return self._req_json("status/nodes", self._params(kwargs))
+
+    def poll(self, **kwargs):
+        """Like read, but returns a (statuses, changed) tuple
+
+        The request is conditional on the previous response for the same
+        arguments; when nothing has changed the previous result is
+        returned with changed set to False.
+
+        """
+        return self._req_json_changed("status/nodes", self._params(kwargs))
+
+    def iter(self, **kwargs):
+        """Like read, but yields the status items one at a time while
+           the response is still downloading, without holding the whole
+           body in memory. Takes the same keyword arguments as read."""
+        return self._req_json_iter("status/nodes", self._params(kwargs))
+
+    def _params(self, kwargs):
         valid_params = ['overall_check_statuses', 'check_id',
                         'monitor_id', 'query', 'include_metrics']
-        params = dict([(k,v) for k, v in kwargs.iteritems()
-                                if k in valid_params])
-
-        return self._req_json("status/nodes", params)
+        return dict([(k,v) for k, v in kwargs.iteritems()
+                            if k in valid_params])
 
 
 class Tags(_ApiEndpoint):
@@ -14,21 +14,76 @@
 # limitations under the License.
 
 
-__all__ = ["hosts", "roledefs", "load"]
+__all__ = ["hosts", "roledefs", "load", "use_disk_cache", "use_node_index",
+           "LazyHosts"]
 
 import sys
 
-from cloudkick_api.base import Connection
-
 _QUERY_CACHE = {}
+_DISK_CACHE = None
+_USE_INDEX = False
+_NODE_INDEX = None
+
+def use_disk_cache(path=None, ttl=300):
+    """Share query results between fab processes through an on-disk
+       cache (by default under ~/.cache/cloudkick), for ttl seconds.
+       Call before load(); pass ttl=None to turn the cache off again."""
+    global _DISK_CACHE
+    if ttl is None:
+        _DISK_CACHE = None
+    else:
+        from cloudkick_api.diskcache import DiskCache
+        _DISK_CACHE = DiskCache(path, ttl)
+
+def use_node_index(enabled=True):
+    """Resolve role queries against a local index of all nodes, so a
+       whole roledefs file costs a single API call. Queries the index
+       can't evaluate are still sent to the server."""
+    global _USE_INDEX, _NODE_INDEX
+    _USE_INDEX = enabled
+    _NODE_INDEX = None
+
+def _connection():
+    # Imported here so a fabfile importing this module doesn't load the
+    # whole client until a host list is actually needed.
+    from cloudkick_api.base import Connection
+    return Connection()
+
+def _config_error(e):
+    # Don't print a huge stack trace if there's a problem. Most likely cloudkick.conf isn't in the path.
+    print e
+    sys.exit()
 
 class RoleDefs(object):
 
+    def _get_index(self):
+        global _NODE_INDEX
+        if _NODE_INDEX is None:
+            from cloudkick_api.nodeindex import NodeIndex
+            data = self._get_data('*')
+            _NODE_INDEX = NodeIndex((data or {}).get('items') or [])
+        return _NODE_INDEX
+
     def _get_data(self, query):
         global _QUERY_CACHE
+        if _USE_INDEX and query != '*' and not query in _QUERY_CACHE:
+            from cloudkick_api.nodeindex import UnsupportedQuery
+            try:
+                _QUERY_CACHE[query] = {'items': self._get_index().query(query)}
+            except UnsupportedQuery:
+                pass
         if not query in _QUERY_CACHE:
-            connection = Connection()
-            _QUERY_CACHE[query] = connection.nodes.read(query=query)
+            connection = _connection()
+            try:
+                if _DISK_CACHE is None:
+                    data = connection.nodes.read(query=query)
+                else:
+                    key = "%s:nodes:%s" % (connection.oauth_key, query)
+                    data = _DISK_CACHE.get_or_set(
+                        key, lambda: connection.nodes.read(query=query))
+            except IOError, e:
+                _config_error(e)
+            _QUERY_CACHE[query] = data
 
         return _QUERY_CACHE[query]
 
@@ -61,13 +116,56 @@ def roledefs():
     rd = RoleDefs()
     return rd
 
+class LazyHosts(list):
+    """
+    List of all hosts that is only fetched when first used, so fab --list
+    and tab completion don't wait for the API
+    """
+
+    def __init__(self):
+        list.__init__(self)
+        self._resolved = False
+
+    def _resolve(self):
+        if not self._resolved:
+            self._resolved = True
+            list.extend(self, hosts())
+        return self
+
+    def _lazy(name):
+        method = getattr(list, name)
+        def wrapper(self, *args):
+            return method(self._resolve(), *args)
+        wrapper.__name__ = name
+        return wrapper
+
+    for _name in ('__iter__', '__len__', '__getitem__', '__getslice__',
+                  '__contains__', '__reversed__', '__eq__', '__ne__',
+                  '__lt__', '__le__', '__gt__', '__ge__', '__add__',
+                  '__iadd__', '__mul__', '__rmul__', '__imul__',
+                  '__repr__', '__str__',
+                  'count', 'index', 'append', 'extend',
+                  'insert', 'pop', 'remove', 'reverse', 'sort',
+                  '__setitem__', '__setslice__', '__delitem__',
+                  '__delslice__'):
+        locals()[_name] = _lazy(_name)
+    del _lazy, _name
+
+    def __radd__(self, other):
+        # list.__add__ would read the unresolved list directly, but a
+        # subclass's reflected method is tried before it.
+        if not isinstance(other, list):
+            return NotImplemented
+        return other + list(self._resolve())
+
+    def __reduce_ex__(self, protocol):
+        # Copies and pickles are plain, already resolved lists.
+        return list, (list(self),)
+
 def load(x = None):
+    """Point env.hosts and env.roledefs at the Cloudkick inventory;
+       nothing is fetched until a task reads them"""
     from fabric.api import env
-    try:
-        env.hosts = hosts()
-        env.roledefs = roledefs()
-    except IOError, e:
-        # Don't print a huge stack trace if there's a problem. Most likely cloudkick.conf isn't in the path.
-        print e
-        sys.exit()
+    env.hosts = LazyHosts()
+    env.roledefs = roledefs()
     return x
@@ -0,0 +1,189 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["CancelledError", "Future", "Executor", "as_completed"]
+
+import sys
+import threading
+import Queue
+
+
+class CancelledError(Exception):
+    """Raised when the result of a cancelled Future is requested"""
+    pass
+
+
+class Future(object):
+    """
+    The pending result of a call running on an Executor
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._state = 'pending'
+
+    def done(self):
+        return self._done.isSet()
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def cancel(self):
+        """Cancel the call if it has not started yet"""
+        self._lock.acquire()
+        try:
+            if self._state != 'pending':
+                return self._state == 'cancelled'
+            self._state = 'cancelled'
+        finally:
+            self._lock.release()
+        self._set(exc_info=(CancelledError, CancelledError(), None))
+        return True
+
+    def _start(self):
+        self._lock.acquire()
+        try:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            return True
+        finally:
+            self._lock.release()
+
+    def result(self, timeout=None):
+        """Wait for the call to finish and return its result, re-raising
+           any exception it raised"""
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise RuntimeError("Timed out waiting for result")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise RuntimeError("Timed out waiting for result")
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, fn):
+        """Call fn(future) once the call has finished"""
+        self._lock.acquire()
+        try:
+            if not self._done.isSet():
+                self._callbacks.append(fn)
+                return
+        finally:
+            self._lock.release()
+        fn(self)
+
+    def _set(self, result=None, exc_info=None):
+        self._lock.acquire()
+        try:
+            if self._state != 'cancelled':
+                self._state = 'finished'
+            self._result = result
+            self._exc_info = exc_info
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for fn in callbacks:
+            fn(self)
+
+
+class Executor(object):
+    """
+    Runs calls on a fixed number of worker threads
+
+    Workers are started lazily and exit when shutdown() is called.
+    """
+
+    def __init__(self, max_workers=8):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.max_workers = max_workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future._start():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future._set(exc_info=sys.exc_info())
+            else:
+                future._set(result)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a Future"""
+        self._lock.acquire()
+        try:
+            if self._shutdown:
+                raise RuntimeError("Executor has been shut down")
+            if len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._worker)
+                t.setDaemon(True)
+                t.start()
+                self._threads.append(t)
+        finally:
+            self._lock.release()
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        self._lock.acquire()
+        try:
+            self._shutdown = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for t in threads:
+            self._queue.put(None)
+        if wait:
+            for t in threads:
+                t.join()
+
+
+def as_completed(futures):
+    """Yield futures as they finish, in completion order"""
+    done = Queue.Queue()
+    futures = list(futures)
+    for f in futures:
+        f.add_done_callback(done.put)
+    for i in xrange(len(futures)):
+        yield done.get()
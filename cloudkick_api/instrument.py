@@ -0,0 +1,124 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["RequestTiming", "LatencyAggregator"]
+
+import collections
+import threading
+import time
+
+# Phases a request's time is split into. dns, connect and tls are only
+# non-zero for requests that had to open a new connection.
+PHASES = ('dns', 'connect', 'tls', 'server', 'read', 'decode')
+
+
+class RequestTiming(object):
+    """
+    Measurements of a single API call, passed to Connection hooks
+
+    phases maps each name in PHASES to seconds spent in it; server is
+    the time from sending the request until the response headers came
+    back. total covers the whole call, including cache lookups and
+    retries. endpoint is the name of the endpoint class that made the
+    call, e.g. 'Nodes'. bytes_in counts the body as received, before
+    any decompression.
+    """
+
+    __slots__ = ('endpoint', 'method', 'url', 'status', 'phases',
+                 'bytes_out', 'bytes_in', 'cache_hit', 'started', 'total',
+                 'error')
+
+    def __init__(self, endpoint, method, url):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.status = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.cache_hit = False
+        self.started = time.time()
+        self.total = None
+        self.error = None
+
+    def __repr__(self):
+        return "<RequestTiming %s %s %s %.1fms>" % (
+            self.endpoint, self.method, self.url, (self.total or 0) * 1000)
+
+
+def _percentile(values, q):
+    rank = (len(values) - 1) * q / 100.0
+    lo = int(rank)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (rank - lo)
+
+
+class LatencyAggregator(object):
+    """
+    Connection hook collecting latency percentiles per endpoint
+
+    Keeps the last window timings of each endpoint.
+
+        agg = LatencyAggregator()
+        conn.add_hook(agg)
+        ...
+        agg.report()  # {'Nodes': {'count': .., 'p50': .., ...}, ...}
+    """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self._samples = {}
+        self._counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, timing):
+        endpoint = timing.endpoint or timing.url
+        self._lock.acquire()
+        try:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = \
+                    collections.deque(maxlen=self.window)
+            samples.append(timing.total)
+            self._counts[endpoint] += 1
+        finally:
+            self._lock.release()
+
+    def report(self):
+        """Return count, mean, p50, p95 and p99 latency in seconds for
+           each endpoint"""
+        self._lock.acquire()
+        try:
+            samples = dict((k, sorted(v)) for k, v in self._samples.iteritems())
+            counts = dict(self._counts)
+        finally:
+            self._lock.release()
+        report = {}
+        for endpoint, values in samples.iteritems():
+            report[endpoint] = {'count': counts[endpoint],
+                                'mean': sum(values) / len(values),
+                                'p50': _percentile(values, 50),
+                                'p95': _percentile(values, 95),
+                                'p99': _percentile(values, 99)}
+        return report
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._samples.clear()
+            self._counts.clear()
+        finally:
+            self._lock.release()
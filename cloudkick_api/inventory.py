@@ -0,0 +1,156 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["InventorySync"]
+
+import os
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from cloudkick_api.nodeindex import NodeIndex
+
+
+def _entry_node_ids(entry):
+    """Return the ids of the nodes a change log entry refers to"""
+    ids = []
+    if entry.get('node_id') is not None:
+        ids.append(entry['node_id'])
+    node = entry.get('node')
+    if isinstance(node, dict):
+        node = node.get('id')
+    if node is not None:
+        ids.append(node)
+    if entry.get('object_type') == 'node' and entry.get('object_id'):
+        ids.append(entry['object_id'])
+    for node_id in entry.get('node_ids') or []:
+        ids.append(node_id)
+    return ids
+
+
+class InventorySync(object):
+    """
+    Local mirror of the account's nodes, kept current from change logs
+
+    The first sync() reads every node. Later calls only ask ChangeLogs
+    for entries since the last sync and re-read the nodes they mention;
+    nodes the API no longer returns are dropped. A full re-read happens
+    when the mirror is older than full_sync_interval seconds or a delta
+    has more than max_changes entries.
+
+    With a state_path, the mirror and its high-water mark are saved
+    after every sync and loaded on start, so restarts resume where the
+    last run stopped.
+    """
+
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+    def __init__(self, conn, state_path=None, full_sync_interval=86400,
+                 max_changes=5000, overlap=60, page_size=100):
+        self.conn = conn
+        self.state_path = state_path
+        self.full_sync_interval = full_sync_interval
+        self.max_changes = max_changes
+        self.overlap = overlap
+        self.page_size = page_size
+        self.nodes = {}
+        self.high_water_mark = None
+        self.last_full_sync = None
+        if state_path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            fp = open(self.state_path, 'r')
+        except IOError:
+            return False
+        try:
+            state = json.load(fp)
+        finally:
+            fp.close()
+        self.nodes = dict((n['id'], n) for n in state['nodes'])
+        self.high_water_mark = state['high_water_mark']
+        self.last_full_sync = state['last_full_sync']
+        return True
+
+    def save(self):
+        if self.state_path is None:
+            return
+        state = {'high_water_mark': self.high_water_mark,
+                 'last_full_sync': self.last_full_sync,
+                 'nodes': self.nodes.values()}
+        tmp = "%s.%d.tmp" % (self.state_path, os.getpid())
+        fp = open(tmp, 'w')
+        try:
+            json.dump(state, fp)
+        finally:
+            fp.close()
+        os.rename(tmp, self.state_path)
+
+    def sync(self):
+        """Bring the mirror up to date, returning the ids of the nodes
+           that were added, updated or removed (None after a full sync)"""
+        now = time.time()
+        if self.high_water_mark is None or self.last_full_sync is None or \
+                now - self.last_full_sync > self.full_sync_interval:
+            changed = self.full_sync()
+        else:
+            changed = self.delta_sync()
+        self.save()
+        return changed
+
+    def full_sync(self):
+        started = time.time()
+        self.nodes = dict((n['id'], n) for n in
+                          self.conn.nodes.iter(page_size=self.page_size))
+        self.high_water_mark = started
+        self.last_full_sync = started
+        return None
+
+    def delta_sync(self):
+        started = time.time()
+        # Start a little before the mark to allow for clock skew.
+        since = time.strftime(self.DATE_FORMAT,
+                              time.gmtime(self.high_water_mark - self.overlap))
+        changed = set()
+        count = 0
+        for entry in self.conn.changelogs.iter(startdate=since,
+                                               page_size=self.page_size):
+            count += 1
+            if count > self.max_changes:
+                return self.full_sync()
+            changed.update(_entry_node_ids(entry))
+
+        ids = list(changed)
+        for i in xrange(0, len(ids), self.page_size):
+            batch = ids[i:i + self.page_size]
+            fresh = dict((n['id'], n) for n in
+                         self.conn.nodes.iter(node_ids=",".join(batch),
+                                              page_size=self.page_size))
+            for node_id in batch:
+                if node_id in fresh:
+                    self.nodes[node_id] = fresh[node_id]
+                else:
+                    self.nodes.pop(node_id, None)
+        self.high_water_mark = started
+        return changed
+
+    def index(self):
+        """Return a NodeIndex over the mirrored nodes"""
+        return NodeIndex(self.nodes.itervalues())
@@ -0,0 +1,194 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["MetricSeries"]
+
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+import downsample as _downsample
+
+COLUMNS = ('ts', 'avg', 'min', 'max')
+
+
+class MetricSeries(object):
+    """
+    Time series of metric data points stored as array-backed columns
+
+    Each of ts, avg, min and max is an array of doubles, 8 bytes a point,
+    so a series takes 32 bytes per point instead of a dict per point.
+    Points are expected in ascending ts order, as the API returns them.
+    """
+
+    __slots__ = COLUMNS + ('name',)
+
+    def __init__(self, ts=None, avg=None, min=None, max=None, name=None):
+        self.ts = array('d', ts or [])
+        self.avg = array('d', avg or [])
+        self.min = array('d', min or self.avg)
+        self.max = array('d', max or self.avg)
+        self.name = name
+        if not (len(self.ts) == len(self.avg) == len(self.min) ==
+                len(self.max)):
+            raise ValueError("All columns must have the same length")
+
+    @classmethod
+    def from_points(cls, points, name=None):
+        """Decode a list of {'ts': .., 'avg': .., 'min': .., 'max': ..}
+           points; min and max default to avg when missing"""
+        series = cls(name=name)
+        ts, avg, min, max = series.ts, series.avg, series.min, series.max
+        for p in points:
+            a = float(p['avg'])
+            ts.append(float(p['ts']))
+            avg.append(a)
+            min.append(float(p.get('min', a)))
+            max.append(float(p.get('max', a)))
+        return series
+
+    @classmethod
+    def from_response(cls, data, metric=None):
+        """Decode a metric_data/custom_metric_data response
+
+        Uses the metric with the given name, or the first one.
+        """
+        metrics = data['metrics']
+        if metric is None:
+            chosen = metrics[0]
+        else:
+            for chosen in metrics:
+                if chosen.get('name') == metric:
+                    break
+            else:
+                raise KeyError(metric)
+        return cls.from_points(chosen['data'], chosen.get('name', metric))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __iter__(self):
+        """Yield (ts, avg, min, max) tuples"""
+        return iter(zip(self.ts, self.avg, self.min, self.max))
+
+    def __repr__(self):
+        return "<MetricSeries %s: %d points>" % (self.name, len(self))
+
+    def _take(self, start, stop):
+        return MetricSeries(self.ts[start:stop], self.avg[start:stop],
+                            self.min[start:stop], self.max[start:stop],
+                            self.name)
+
+    def _select(self, indices):
+        return MetricSeries([self.ts[i] for i in indices],
+                            [self.avg[i] for i in indices],
+                            [self.min[i] for i in indices],
+                            [self.max[i] for i in indices],
+                            self.name)
+
+    def thin(self, max_points, method='lttb'):
+        """Return at most max_points points chosen for charting, with
+           'lttb' (shape preserving) or 'minmax' (spike preserving)"""
+        if method == 'lttb':
+            select = _downsample.lttb
+        elif method == 'minmax':
+            select = _downsample.minmax
+        else:
+            raise ValueError("Unknown method %r" % method)
+        if len(self.ts) <= max_points:
+            return self
+        return self._select(select(self.ts, self.avg, max_points))
+
+    def between(self, start=None, end=None):
+        """Return the points with start <= ts <= end"""
+        lo = 0
+        hi = len(self.ts)
+        if start is not None:
+            lo = bisect_left(self.ts, start)
+        if end is not None:
+            hi = bisect_right(self.ts, end)
+        return self._take(lo, hi)
+
+    def _aggregate(self, keys):
+        """Merge runs of consecutive points sharing the same key"""
+        out = MetricSeries(name=self.name)
+        ts, avg, min_, max_ = self.ts, self.avg, self.min, self.max
+        n = len(ts)
+        i = 0
+        while i < n:
+            key = keys[i]
+            j = i + 1
+            while j < n and keys[j] == key:
+                j += 1
+            out.ts.append(key)
+            out.avg.append(math.fsum(avg[i:j]) / (j - i))
+            out.min.append(min(min_[i:j]))
+            out.max.append(max(max_[i:j]))
+            i = j
+        return out
+
+    def resample(self, interval):
+        """Aggregate into fixed buckets of interval seconds, each stamped
+           with the bucket start; avg is averaged, min and max kept"""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        return self._aggregate([t - t % interval for t in self.ts])
+
+    def downsample(self, factor):
+        """Aggregate every factor consecutive points into one, stamped
+           with the first point's ts"""
+        if factor < 1:
+            raise ValueError("factor must be at least 1")
+        ts = self.ts
+        return self._aggregate([ts[i - i % factor] for i in xrange(len(ts))])
+
+    def rolling_mean(self, window, column='avg'):
+        """Return an array with the mean of the last window values of
+           column at each point (fewer at the start)"""
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        values = getattr(self, column)
+        out = array('d')
+        total = 0.0
+        for i, v in enumerate(values):
+            total += v
+            if i >= window:
+                total -= values[i - window]
+            out.append(total / (i + 1 if i < window else window))
+        return out
+
+    def percentile(self, q, column='avg'):
+        """Return the q-th percentile (0-100) of column, interpolating
+           linearly between the closest ranks"""
+        if not 0 <= q <= 100:
+            raise ValueError("q must be between 0 and 100")
+        values = sorted(getattr(self, column))
+        if not values:
+            raise ValueError("percentile of an empty series")
+        rank = (len(values) - 1) * q / 100.0
+        lo = int(math.floor(rank))
+        hi = int(math.ceil(rank))
+        return values[lo] + (values[hi] - values[lo]) * (rank - lo)
+
+    def summary(self):
+        """Return count, min, max, mean and p95 of the series"""
+        if not self.ts:
+            return {'count': 0}
+        return {'count': len(self.ts),
+                'min': min(self.min),
+                'max': max(self.max),
+                'mean': math.fsum(self.avg) / len(self.avg),
+                'p95': self.percentile(95)}
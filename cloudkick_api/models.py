@@ -0,0 +1,240 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["Node", "Check", "Monitor", "from_items"]
+
+import threading
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# Small dicts such as tags and providers repeat across thousands of
+# nodes; equal ones are stored once. Bounded so odd payloads can't grow
+# it without limit.
+_SHARED = {}
+_SHARED_MAX = 65536
+_SHARED_LOCK = threading.Lock()
+
+# Slot value of fields missing from the response, as opposed to null.
+_MISSING = object()
+
+
+def _intern(s):
+    """Intern a string, converting ASCII unicode to str first"""
+    if isinstance(s, unicode):
+        try:
+            s = str(s)
+        except UnicodeEncodeError:
+            return s
+    return intern(s)
+
+
+class _Frozen(tuple):
+    """A dict stored as a tuple of (key, value) pairs"""
+    __slots__ = ()
+
+
+def _freeze(value):
+    if isinstance(value, basestring):
+        return _intern(value)
+    if isinstance(value, dict):
+        frozen = _Frozen((_intern(k), _freeze(v))
+                         for k, v in sorted(value.iteritems()))
+        # Only string and null values are shared: True == 1 == 1.0 with
+        # equal hashes, so other values could come back as another type.
+        if len(frozen) <= 4 and not [v for k, v in frozen
+                                     if v is not None and
+                                     not isinstance(v, basestring)]:
+            return _share(frozen)
+        return frozen
+    if isinstance(value, list):
+        return tuple([_freeze(v) for v in value])
+    return value
+
+
+def _share(frozen):
+    shared = _SHARED.get(frozen)
+    if shared is not None:
+        return shared
+    _SHARED_LOCK.acquire()
+    try:
+        if len(_SHARED) < _SHARED_MAX:
+            shared = _SHARED.setdefault(frozen, frozen)
+        else:
+            shared = frozen
+    finally:
+        _SHARED_LOCK.release()
+    return shared
+
+
+def _thaw(value):
+    if isinstance(value, _Frozen):
+        return dict((k, _thaw(v)) for k, v in value)
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class _Model(object):
+    """
+    Base for slotted API objects
+
+    Each name in _fields is stored in a slot of the same name prefixed
+    with an underscore and read through a property; any other keys of
+    the response are kept in _extra. Fields in _lazy are kept as
+    compact JSON text and only decoded when read. Fields the response
+    didn't have read as None but are left out of keys() and to_dict().
+    """
+
+    __slots__ = ('_extra',)
+    _fields = ()
+    _lazy = ()
+
+    def __init__(self, data):
+        data = dict(data)
+        for name in self._fields:
+            value = data.pop(name, _MISSING)
+            if value is _MISSING:
+                pass
+            elif name in self._lazy:
+                value = _intern(json.dumps(value, sort_keys=True,
+                                           separators=(',', ':')))
+            else:
+                value = _freeze(value)
+            setattr(self, '_' + name, value)
+        if data:
+            self._extra = _freeze(data)
+        else:
+            self._extra = None
+
+    def _get(self, name):
+        value = getattr(self, '_' + name)
+        if value is _MISSING:
+            return None
+        if name in self._lazy:
+            return json.loads(value)
+        return _thaw(value)
+
+    def keys(self):
+        keys = [name for name in self._fields
+                if getattr(self, '_' + name) is not _MISSING]
+        if self._extra is not None:
+            keys.extend(k for k, v in self._extra)
+        return keys
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            if getattr(self, '_' + key) is not _MISSING:
+                return self._get(key)
+        elif self._extra is not None:
+            for k, v in self._extra:
+                if k == key:
+                    return _thaw(v)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """Return the object as the plain dict the API sent"""
+        return dict((k, self[k]) for k in self.keys())
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __eq__(self, other):
+        if isinstance(other, _Model):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.id)
+
+
+def _model(name, fields, lazy=()):
+    """Create a _Model subclass with a slot and property per field"""
+    attrs = {'__slots__': tuple('_' + f for f in fields),
+             '_fields': tuple(fields),
+             '_lazy': frozenset(lazy)}
+    for field in fields:
+        attrs[field] = property(lambda self, f=field: self._get(f))
+    return type(name, (_Model,), attrs)
+
+
+class Node(_model('_Node', ('id', 'name', 'ipaddress', 'is_active',
+                            'provider', 'tags', 'details', 'ssh_user',
+                            'ssh_port', 'public_ips', 'private_ips',
+                            'status'),
+                  lazy=('details',))):
+    """
+    A node, as returned by Nodes.read
+
+    Strings are interned, small sub-dicts such as tags are shared between
+    nodes, and details are kept as JSON text until read. Attributes and
+    item access return the same values as the API's dict would.
+    """
+
+    __slots__ = ()
+
+    @property
+    def tag_names(self):
+        names = []
+        for tag in self.tags or ():
+            if isinstance(tag, dict):
+                tag = tag.get('name')
+            if tag is not None:
+                names.append(tag)
+        return names
+
+
+class Check(_model('_Check', ('id', 'node_id', 'monitor_id', 'type', 'name',
+                              'status', 'details', 'is_active'),
+                   lazy=('details',))):
+    """A check, as returned by Checks.read"""
+
+    __slots__ = ()
+
+
+class Monitor(_model('_Monitor', ('id', 'name', 'query', 'notes',
+                                  'is_active'))):
+    """A monitor, as returned by Monitors.read"""
+
+    __slots__ = ()
+
+
+def from_items(cls, items):
+    """Build a list of cls from the items of a response or an iterable"""
+    if isinstance(items, dict):
+        items = items.get('items') or []
+    return [cls(item) for item in items]
@@ -0,0 +1,173 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["NodeIndex", "UnsupportedQuery"]
+
+import fnmatch
+import re
+
+_TOKENS = re.compile(r'[^\s()"]+:"[^"]*"|"[^"]*"|\(|\)|[^\s()]+')
+
+# Query fields and the node attribute indexed under them. Any other
+# field is looked up in the node's details, using dots for nesting.
+FIELDS = {
+    'tag': 'tags',
+    'node': 'name',
+    'name': 'name',
+    'provider': 'provider',
+    'ip': 'ipaddress',
+    'id': 'id',
+}
+
+
+class UnsupportedQuery(ValueError):
+    """Raised for queries the local index can't evaluate"""
+    pass
+
+
+def _tags(node):
+    for tag in node.get('tags') or []:
+        if isinstance(tag, dict):
+            tag = tag.get('name')
+        if tag is not None:
+            yield tag
+
+
+def _providers(node):
+    provider = node.get('provider')
+    if isinstance(provider, dict):
+        provider = provider.get('name')
+    for value in (provider, node.get('provider_name'), node.get('provider_id')):
+        if value is not None:
+            yield value
+
+
+def _details(value, prefix=''):
+    """Yield (dotted key, leaf value) pairs of a nested details dict"""
+    if isinstance(value, dict):
+        for k, v in value.iteritems():
+            for pair in _details(v, prefix + k + '.'):
+                yield pair
+    elif isinstance(value, list):
+        for v in value:
+            for pair in _details(v, prefix):
+                yield pair
+    else:
+        yield prefix[:-1], value
+
+
+def _norm(value):
+    if isinstance(value, basestring):
+        return value.lower()
+    return unicode(value).lower()
+
+
+class NodeIndex(object):
+    """
+    In-memory inverted index over a snapshot of nodes
+
+    Evaluates the common Cloudkick query forms locally: '*', field:value
+    terms for tag, node (name), provider, ip, id and details keys, with
+    '*' wildcards in values, combined with and, or, not and parentheses.
+    Adjacent terms are and-ed. Matching is case-insensitive. Anything
+    else raises UnsupportedQuery so callers can ask the server instead.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self._all = set(xrange(len(self.nodes)))
+        self._index = {}
+        for i, node in enumerate(self.nodes):
+            self._add(i, 'tags', _tags(node))
+            self._add(i, 'provider', _providers(node))
+            for attr in ('name', 'ipaddress', 'id'):
+                if node.get(attr) is not None:
+                    self._add(i, attr, [node[attr]])
+            for key, value in _details(node.get('details') or {}):
+                if value is not None:
+                    self._add(i, 'details.' + key.lower(), [value])
+
+    def _add(self, i, field, values):
+        postings = self._index.setdefault(field, {})
+        for value in values:
+            postings.setdefault(_norm(value), set()).add(i)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def query(self, query):
+        """Return the nodes matching query, in snapshot order"""
+        tokens = _TOKENS.findall(query)
+        if not tokens:
+            raise UnsupportedQuery(query)
+        pos, matches = self._or(tokens, 0)
+        if pos != len(tokens):
+            raise UnsupportedQuery(query)
+        return [self.nodes[i] for i in sorted(matches)]
+
+    def _or(self, tokens, pos):
+        pos, result = self._and(tokens, pos)
+        while pos < len(tokens) and tokens[pos].lower() == 'or':
+            pos, other = self._and(tokens, pos + 1)
+            result = result | other
+        return pos, result
+
+    def _and(self, tokens, pos):
+        pos, result = self._not(tokens, pos)
+        while pos < len(tokens) and tokens[pos] != ')' and \
+                tokens[pos].lower() != 'or':
+            if tokens[pos].lower() == 'and':
+                pos += 1
+            pos, other = self._not(tokens, pos)
+            result = result & other
+        return pos, result
+
+    def _not(self, tokens, pos):
+        if pos < len(tokens) and tokens[pos].lower() == 'not':
+            pos, result = self._not(tokens, pos + 1)
+            return pos, self._all - result
+        return self._term(tokens, pos)
+
+    def _term(self, tokens, pos):
+        if pos >= len(tokens):
+            raise UnsupportedQuery("Unexpected end of query")
+        token = tokens[pos]
+        if token == '(':
+            pos, result = self._or(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise UnsupportedQuery("Unbalanced parentheses")
+            return pos + 1, result
+        if token == '*':
+            return pos + 1, set(self._all)
+        if ':' not in token or token.lower() in ('and', 'or', ')'):
+            raise UnsupportedQuery(token)
+        field, value = token.split(':', 1)
+        if len(value) > 1 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        field = field.lower()
+        if not field.startswith('details.'):
+            field = FIELDS.get(field, 'details.' + field)
+        return pos + 1, self._match(field, _norm(value))
+
+    def _match(self, field, value):
+        postings = self._index.get(field, {})
+        if '*' not in value and '?' not in value:
+            return set(postings.get(value, ()))
+        result = set()
+        for key, ids in postings.iteritems():
+            if fnmatch.fnmatchcase(key, value):
+                result |= ids
+        return result
@@ -0,0 +1,157 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["MetricPipeline", "map_metrics", "summarize"]
+
+import collections
+import multiprocessing
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from cloudkick_api.futures import Executor, Future
+from cloudkick_api.metrics import MetricSeries
+
+
+def summarize(raw, metric=None):
+    """Decode a raw metric_data response and return the summary() of
+       its series; the default MetricPipeline function"""
+    return MetricSeries.from_response(json.loads(raw), metric).summary()
+
+
+def _apply(func, raw):
+    # Runs in a worker process. Exceptions are returned rather than
+    # raised so one bad response doesn't fail the whole map.
+    try:
+        return True, func(raw)
+    except Exception, e:
+        return False, e
+
+
+class MetricPipeline(object):
+    """
+    Fetches metric data on threads and processes it on a process pool
+
+    I/O threads download the raw, undecoded metric_data responses and
+    hand them to worker processes, which run func(raw) and send back
+    only its result, so JSON decoding and aggregation use every core.
+    At most window nodes are in flight between fetching and processing
+    at any time, which bounds memory when the workers fall behind the
+    network, or the consumer behind both.
+
+    func runs in another process, so it must be picklable: a module
+    level function, or a functools.partial of one.
+
+        pipeline = MetricPipeline(conn)
+        try:
+            for node_id, summary in pipeline.map(node_ids, 'ping'):
+                ...
+        finally:
+            pipeline.close()
+    """
+
+    def __init__(self, conn, processes=None, io_workers=8, window=None):
+        self.conn = conn
+        # Fork the workers before any I/O thread exists.
+        self.pool = multiprocessing.Pool(processes)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.io_workers = io_workers
+        self.window = window or 2 * (self.processes + io_workers)
+        self._executor = Executor(io_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fetch(self, node_id, name, custom, start, end):
+        return self.conn.nodes._metric_data_raw(node_id, name, start, end,
+                                                custom)
+
+    def _submit(self, func, node_id, name, custom, start, end):
+        """Start fetching node_id; the returned Future resolves to the
+           AsyncResult of processing it"""
+        out = Future()
+        pool = self.pool
+
+        def fetched(future):
+            if out.cancelled():
+                return
+            if future._exc_info is not None:
+                out._set(exc_info=future._exc_info)
+                return
+            try:
+                out._set(pool.apply_async(_apply, (func, future.result())))
+            except:
+                out._set(exc_info=sys.exc_info())
+
+        self._executor.submit(self._fetch, node_id, name, custom, start,
+                              end).add_done_callback(fetched)
+        return out
+
+    def map(self, node_ids, check_name, func=summarize, custom=False,
+            start=None, end=None):
+        """Yield (node_id, func(raw)) for each node, in the order of
+           node_ids
+
+        raw is the body of the node's metric_data response (or
+        custom_metric_data with custom set). If fetching or processing
+        a node fails, its result is the exception instead.
+        """
+        pending = collections.deque()
+        node_ids = iter(node_ids)
+        try:
+            for node_id in node_ids:
+                pending.append((node_id, self._submit(func, node_id,
+                                                      check_name, custom,
+                                                      start, end)))
+                if len(pending) >= self.window:
+                    break
+            while pending:
+                node_id, out = pending.popleft()
+                try:
+                    result = out.result().get()[1]
+                except Exception, e:
+                    result = e
+                for next_id in node_ids:
+                    pending.append((next_id, self._submit(func, next_id,
+                                                          check_name, custom,
+                                                          start, end)))
+                    break
+                yield node_id, result
+        finally:
+            for node_id, out in pending:
+                out.cancel()
+
+    def close(self):
+        self._executor.shutdown()
+        self.pool.close()
+        self.pool.join()
+
+
+def map_metrics(conn, node_ids, check_name, func=summarize, custom=False,
+                processes=None, io_workers=8, window=None):
+    """Run a MetricPipeline over node_ids and return a list of
+       (node_id, result) pairs in input order"""
+    pipeline = MetricPipeline(conn, processes, io_workers, window)
+    try:
+        return list(pipeline.map(node_ids, check_name, func, custom))
+    finally:
+        pipeline.close()
@@ -0,0 +1,355 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["ConnectionPool"]
+
+import base64
+import httplib
+import socket
+import ssl
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+# Methods that may be sent again after the connection broke while the
+# server could already have been processing them.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+def _timed_connect(conn):
+    """Open conn's socket, recording how long name resolution and the
+       TCP connect took in conn.connect_timings
+
+    Like socket.create_connection, every address the host resolves to is
+    tried in turn.
+    """
+    start = time.time()
+    addrs = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+    resolved = time.time()
+    error = socket.error("getaddrinfo returned no addresses")
+    for family, socktype, proto, canonname, sockaddr in addrs:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.timeout)
+            if conn.source_address:
+                sock.bind(conn.source_address)
+            sock.connect(sockaddr)
+        except socket.error, e:
+            error = e
+            if sock is not None:
+                sock.close()
+            continue
+        conn.sock = sock
+        conn.connect_timings = {'dns': resolved - start,
+                                'connect': time.time() - resolved}
+        return
+    raise error
+
+
+class _TimedHTTPConnection(httplib.HTTPConnection):
+
+    connect_timings = None
+
+    def connect(self):
+        _timed_connect(self)
+        if self._tunnel_host:
+            self._tunnel()
+
+
+class _TimedHTTPSConnection(httplib.HTTPSConnection):
+
+    connect_timings = None
+
+    def connect(self):
+        _timed_connect(self)
+        if self._tunnel_host:
+            self._tunnel()
+        start = time.time()
+        context = getattr(self, '_context', None)
+        if context is not None:
+            self.sock = context.wrap_socket(
+                self.sock, server_hostname=self._tunnel_host or self.host)
+        else:
+            self.sock = ssl.wrap_socket(self.sock, self.key_file,
+                                        self.cert_file)
+        self.connect_timings['tls'] = time.time() - start
+
+
+class PooledResponse(object):
+    """
+    Wrapper around an httplib response that hands its connection back
+    to the pool once the body has been fully read.
+    """
+
+    def __init__(self, pool, key, conn, response, timing=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._timing = timing
+        self.status = response.status
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, amt=None):
+        if self._conn is None:
+            return ''
+        timing = self._timing
+        if timing is not None:
+            start = time.time()
+        try:
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(amt)
+        except:
+            self._discard()
+            raise
+        if timing is not None:
+            timing.phases['read'] += time.time() - start
+            timing.bytes_in += len(data)
+        if amt is None or not data or self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        """Drop the connection unless the body was already consumed"""
+        if self._conn is not None:
+            self._discard()
+
+    def _release(self):
+        conn, self._conn = self._conn, None
+        if self._response.will_close:
+            conn.close()
+        else:
+            self._pool._put(self._key, conn)
+
+    def _discard(self):
+        conn, self._conn = self._conn, None
+        conn.close()
+
+
+class _NotSent(Exception):
+    """Wraps an error raised before the request was fully written"""
+
+    def __init__(self, exc_info):
+        Exception.__init__(self, exc_info[1])
+        self.exc_info = exc_info
+
+
+def _proxy(url):
+    """Split a proxy url into (host, port, Proxy-Authorization value)"""
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlparse.urlsplit(url)
+    auth = None
+    if parts.username is not None:
+        credentials = "%s:%s" % (urllib.unquote(parts.username),
+                                 urllib.unquote(parts.password or ''))
+        auth = "Basic " + base64.b64encode(credentials)
+    return parts.hostname, parts.port or 80, auth
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connection pool
+
+    Idle connections are kept per (scheme, host, port) up to maxsize and
+    are dropped once they have been idle for longer than idle_timeout
+    seconds. Checking a connection in and out is thread-safe; when no
+    idle connection is available a new one is opened.
+
+    If a reused connection turns out to have been closed by the server,
+    the request is sent again on a new connection, but only if it failed
+    before being fully written or its method is idempotent; a POST the
+    server may already have acted on is never repeated.
+
+    proxies maps url schemes to proxy urls, as returned by
+    urllib.getproxies(), which is used by default so the http_proxy,
+    https_proxy and no_proxy environment variables are honoured like
+    they are by urllib. https is tunnelled through the proxy with
+    CONNECT. Pass proxies={} to always connect directly.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60, timeout=None,
+                 proxies=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        if proxies is None:
+            proxies = urllib.getproxies()
+        self.proxies = proxies
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _proxy_for(self, scheme, host):
+        url = self.proxies.get(scheme)
+        if not url:
+            return None
+        if urllib.proxy_bypass(host):
+            return None
+        return _proxy(url)
+
+    def _new_conn(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            cls = _TimedHTTPSConnection
+        else:
+            cls = _TimedHTTPConnection
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        proxy = self._proxy_for(scheme, host)
+        if proxy is None:
+            conn = cls(host, port, **kwargs)
+            conn.proxy_auth = None
+            conn.via_proxy = False
+            return conn
+        proxy_host, proxy_port, auth = proxy
+        conn = cls(proxy_host, proxy_port, **kwargs)
+        conn.via_proxy = True
+        if scheme == "https":
+            tunnel_headers = {}
+            if auth:
+                tunnel_headers['Proxy-Authorization'] = auth
+            conn.set_tunnel(host, port, tunnel_headers)
+            # Requests inside the tunnel go straight to the server.
+            conn.via_proxy = False
+            auth = None
+        conn.proxy_auth = auth
+        return conn
+
+    def _get(self, key):
+        """Return an idle connection for key, or None"""
+        now = time.time()
+        stale = []
+        conn = None
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout:
+                    stale.append(candidate)
+                    continue
+                conn = candidate
+                break
+        finally:
+            self._lock.release()
+        for c in stale:
+            c.close()
+        return conn
+
+    def _put(self, key, conn):
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                conn = None
+        finally:
+            self._lock.release()
+        if conn is not None:
+            conn.close()
+
+    def request(self, scheme, host, port, method, path, body=None,
+                headers=None, timing=None):
+        """Send a request and return a PooledResponse
+
+        If timing is a RequestTiming, the connect, server and read
+        phases and the bytes sent and received are added to it.
+        """
+        key = (scheme, host, port)
+        headers = headers or {}
+        conn = self._get(key)
+        reused = conn is not None
+        if not reused:
+            conn = self._new_conn(key)
+        try:
+            response = self._send(conn, key, method, path, body, headers,
+                                  timing)
+        except (_NotSent, httplib.HTTPException, socket.error), e:
+            conn.close()
+            # The server may have dropped an idle keep-alive connection;
+            # retry once on a fresh one if that can't repeat the request.
+            retry = reused and (isinstance(e, _NotSent) or
+                                (method in IDEMPOTENT_METHODS and
+                                 not isinstance(e, socket.timeout)))
+            if not retry:
+                if isinstance(e, _NotSent):
+                    raise e.exc_info[0], e.exc_info[1], e.exc_info[2]
+                raise
+            conn = self._new_conn(key)
+            try:
+                response = self._send(conn, key, method, path, body, headers,
+                                      timing)
+            except _NotSent, e:
+                conn.close()
+                raise e.exc_info[0], e.exc_info[1], e.exc_info[2]
+            except:
+                conn.close()
+                raise
+        return PooledResponse(self, key, conn, response, timing)
+
+    def _write(self, conn, key, method, path, body, headers):
+        if conn.via_proxy:
+            scheme, host, port = key
+            netloc = host
+            if port:
+                netloc = "%s:%d" % (host, port)
+            path = "%s://%s%s" % (scheme, netloc, path)
+            if conn.proxy_auth:
+                headers = dict(headers)
+                headers['Proxy-Authorization'] = conn.proxy_auth
+        try:
+            conn.request(method, path, body, headers)
+        except (httplib.HTTPException, socket.error):
+            raise _NotSent(sys.exc_info())
+
+    def _send(self, conn, key, method, path, body, headers, timing):
+        if timing is None:
+            self._write(conn, key, method, path, body, headers)
+            return conn.getresponse()
+        start = time.time()
+        self._write(conn, key, method, path, body, headers)
+        response = conn.getresponse()
+        elapsed = time.time() - start
+        connect_timings = conn.connect_timings
+        if connect_timings:
+            conn.connect_timings = None
+            for phase, seconds in connect_timings.iteritems():
+                timing.phases[phase] += seconds
+                elapsed -= seconds
+        timing.phases['server'] += elapsed
+        timing.bytes_out += len(method) + len(path) + len(body or '')
+        timing.status = response.status
+        return response
+
+    def close(self):
+        """Close all idle connections"""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.itervalues():
+            for conn, last_used in conns:
+                conn.close()
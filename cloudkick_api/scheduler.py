@@ -0,0 +1,141 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["RequestScheduler", "INTERACTIVE", "BULK"]
+
+import calendar
+import fnmatch
+import heapq
+import random
+import rfc822
+import threading
+import time
+
+# Lower values are served first when requests wait for the rate limit.
+INTERACTIVE = 0
+BULK = 10
+
+DEFAULT_PRIORITIES = [
+    ('POST', 'nodes/*/add_tag', BULK),
+    ('POST', 'nodes/*/remove_tag', BULK),
+]
+
+
+class RequestScheduler(object):
+    """
+    Paces and retries the requests of a Connection
+
+    rate is the sustained number of requests per second allowed, with
+    bursts of up to burst requests (default: one second's worth); None
+    disables pacing. Requests waiting for the rate limit are served in
+    priority order, using the first matching (method, url pattern,
+    priority) rule in priorities, or INTERACTIVE.
+
+    Responses with a status in retry_statuses are retried up to
+    max_retries times with exponential backoff and full jitter, or
+    after the delay the server asked for in Retry-After. POSTs are only
+    retried on 429, which means the request was not processed. When
+    Retry-After is longer than max_backoff the response is returned
+    instead of retried.
+    """
+
+    def __init__(self, rate=None, burst=None, max_retries=3, backoff=0.5,
+                 max_backoff=30.0, retry_statuses=(429, 500, 502, 503, 504),
+                 priorities=None):
+        self.rate = rate
+        self.burst = burst or max(rate or 1, 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        if priorities is None:
+            priorities = DEFAULT_PRIORITIES
+        self.priorities = list(priorities)
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._waiters = []
+        self._seq = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def priority(self, method, url):
+        for rule_method, pattern, priority in self.priorities:
+            if rule_method in (None, method) and fnmatch.fnmatchcase(url, pattern):
+                return priority
+        return INTERACTIVE
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=INTERACTIVE):
+        """Block until the rate limit lets a request of this priority go"""
+        if self.rate is None:
+            return
+        cond = self._cond
+        cond.acquire()
+        try:
+            self._seq += 1
+            me = (priority, self._seq)
+            heapq.heappush(self._waiters, me)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == me:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            heapq.heappop(self._waiters)
+                            cond.notifyAll()
+                            return
+                        cond.wait((1 - self._tokens) / self.rate)
+                    else:
+                        cond.wait()
+            except:
+                if me in self._waiters:
+                    self._waiters.remove(me)
+                    heapq.heapify(self._waiters)
+                    cond.notifyAll()
+                raise
+        finally:
+            cond.release()
+
+    def should_retry(self, method, status, attempt):
+        if attempt >= self.max_retries or status not in self.retry_statuses:
+            return False
+        return method == 'GET' or status == 429
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt + 1, or None if
+           Retry-After asks for longer than max_backoff and the request
+           should not be retried"""
+        if retry_after:
+            retry_after = retry_after.strip()
+            wait = None
+            if retry_after.isdigit():
+                wait = float(retry_after)
+            else:
+                parsed = rfc822.parsedate(retry_after)
+                if parsed is not None:
+                    wait = max(calendar.timegm(parsed) - time.time(), 0)
+            # Retrying any sooner than the server allows would only trip
+            # the quota again.
+            if wait is not None:
+                if wait > self.max_backoff:
+                    return None
+                return wait
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * (2 ** attempt)))
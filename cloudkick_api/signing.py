@@ -0,0 +1,59 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["SigningContext"]
+
+import binascii
+import hashlib
+import hmac
+
+from oauth import oauth
+
+
+class _PrecomputedHMAC_SHA1(oauth.OAuthSignatureMethod_HMAC_SHA1):
+    """
+    HMAC-SHA1 signature method for a single consumer, with the keyed
+    HMAC state computed once and copied for every signature
+    """
+
+    def __init__(self, consumer):
+        key = '%s&' % oauth.escape(consumer.secret)
+        self._hmac = hmac.new(key, digestmod=hashlib.sha1)
+
+    def build_signature(self, oauth_request, consumer, token):
+        key, raw = self.build_signature_base_string(oauth_request, consumer,
+                                                    token)
+        hashed = self._hmac.copy()
+        hashed.update(raw)
+        return binascii.b2a_base64(hashed.digest())[:-1]
+
+
+class SigningContext(object):
+    """
+    Everything needed to sign requests for one set of credentials
+    """
+
+    def __init__(self, oauth_key, oauth_secret):
+        self.consumer = oauth.OAuthConsumer(oauth_key, oauth_secret)
+        self.signature_method = _PrecomputedHMAC_SHA1(self.consumer)
+
+    def sign(self, url, method, parameters):
+        """Return a signed OAuthRequest"""
+        oauth_request = oauth.OAuthRequest.from_consumer_and_token(
+            self.consumer, http_url=url, http_method=method,
+            parameters=parameters)
+        oauth_request.sign_request(self.signature_method, self.consumer, None)
+        return oauth_request
@@ -0,0 +1,67 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["SingleFlight"]
+
+import sys
+import threading
+
+from cloudkick_api.futures import Future
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls with the same key into one
+
+    The first thread to call do() for a key runs the function; threads
+    calling do() with that key while it is running wait for it and get
+    the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        self._lock.acquire()
+        try:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        finally:
+            self._lock.release()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except:
+            exc_info = sys.exc_info()
+            self._forget(key)
+            call._set(exc_info=exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self._forget(key)
+        call._set(result)
+        return result
+
+    def _forget(self, key):
+        self._lock.acquire()
+        try:
+            del self._calls[key]
+        finally:
+            self._lock.release()
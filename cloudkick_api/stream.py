@@ -0,0 +1,125 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["iter_items"]
+
+import re
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+_WHITESPACE = re.compile(r'\s*')
+_DELIMITERS = frozenset(' \t\n\r,]}')
+_NUMBERS = (int, long, float)
+_decoder = json.JSONDecoder()
+
+
+class _Reader(object):
+    """
+    Buffered reader over a file-like object, decoding JSON values from
+    the buffer as soon as enough bytes have arrived
+    """
+
+    def __init__(self, fp, chunk_size):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self._fp.read(size or self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer.
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at EOF"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected %r at offset %d, found %r" %
+                             (chars, self.pos, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode the next JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Grow geometrically so a large value is not re-parsed
+                # once per chunk.
+                if not self._fill(max(self._chunk_size,
+                                      len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number cut off by the end of the buffer may continue in
+            # the next chunk, so only trust it once a delimiter follows.
+            if (isinstance(obj, _NUMBERS) and not self.eof and
+                    self.buf[end:end + 1] not in _DELIMITERS and
+                    self._fill()):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_items(fp, key='items', chunk_size=16384):
+    """
+    Incrementally decode a JSON object read from fp and yield the
+    elements of its top-level key array as they arrive.
+
+    Only one element (plus one chunk of input) is held in memory at a
+    time, so the first items can be used before the whole response has
+    been downloaded. Yields nothing if the object has no such key.
+    """
+    reader = _Reader(fp, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return
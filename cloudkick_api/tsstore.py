@@ -0,0 +1,181 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["TimeSeriesStore"]
+
+import mmap
+import os
+import struct
+import sys
+import urllib
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from cloudkick_api.metrics import MetricSeries
+
+# One record per point: ts, avg, min, max as little-endian doubles.
+_RECORD = struct.Struct('<dddd')
+_SIZE = _RECORD.size
+
+
+class TimeSeriesStore(object):
+    """
+    Local append-only store of metric history
+
+    Every (node_id, check, metric) series lives in its own file of fixed
+    size records sorted by ts. Range queries memory-map the file and
+    binary search it, so only the requested records are read.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _dir(self, node_id, check):
+        return os.path.join(self.root, urllib.quote(str(node_id), safe=''),
+                            urllib.quote(str(check), safe=''))
+
+    def _path(self, node_id, check, metric):
+        return os.path.join(self._dir(node_id, check),
+                            urllib.quote(str(metric), safe='') + ".ts")
+
+    def metrics(self, node_id, check):
+        """Return the names of the metrics stored for a node's check"""
+        try:
+            names = os.listdir(self._dir(node_id, check))
+        except OSError:
+            return []
+        return [urllib.unquote(n[:-3]) for n in names if n.endswith(".ts")]
+
+    def last_ts(self, node_id, check, metric):
+        """Return the ts of the newest stored point, or None"""
+        try:
+            fp = open(self._path(node_id, check, metric), 'rb')
+        except IOError:
+            return None
+        try:
+            fp.seek(0, os.SEEK_END)
+            count = fp.tell() // _SIZE
+            if count == 0:
+                return None
+            fp.seek((count - 1) * _SIZE)
+            return _RECORD.unpack(fp.read(_SIZE))[0]
+        finally:
+            fp.close()
+
+    def append(self, node_id, check, metric, series):
+        """Append the points of a MetricSeries newer than the last
+           stored one, returning how many were written"""
+        path = self._path(node_id, check, metric)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        fp = open(path, 'ab')
+        try:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            # Read the high-water mark under the lock, so concurrent
+            # writers never store a point twice.
+            last = self.last_ts(node_id, check, metric)
+            fp.seek(0, os.SEEK_END)
+            # Drop a partial record left behind by an interrupted write.
+            fp.truncate(fp.tell() - fp.tell() % _SIZE)
+            records = []
+            for point in series:
+                if last is None or point[0] > last:
+                    records.append(_RECORD.pack(*point))
+                    last = point[0]
+            fp.write(''.join(records))
+            return len(records)
+        finally:
+            fp.close()
+
+    def range(self, node_id, check, metric, start=None, end=None):
+        """Return the stored points with start <= ts <= end as a
+           MetricSeries"""
+        try:
+            fp = open(self._path(node_id, check, metric), 'rb')
+        except IOError:
+            return MetricSeries(name=metric)
+        try:
+            count = os.fstat(fp.fileno()).st_size // _SIZE
+            if count == 0:
+                return MetricSeries(name=metric)
+            mm = mmap.mmap(fp.fileno(), count * _SIZE, access=mmap.ACCESS_READ)
+            try:
+                lo = 0
+                hi = count
+                if start is not None:
+                    lo = self._bisect(mm, start, 0, count, False)
+                if end is not None:
+                    hi = self._bisect(mm, end, lo, count, True)
+                values = array('d')
+                values.fromstring(mm[lo * _SIZE:hi * _SIZE])
+            finally:
+                mm.close()
+        finally:
+            fp.close()
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return MetricSeries(values[0::4], values[1::4], values[2::4],
+                            values[3::4], metric)
+
+    def _bisect(self, mm, ts, lo, hi, right):
+        unpack_from = _RECORD.unpack_from
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = unpack_from(mm, mid * _SIZE)[0]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sync(self, conn, node_id, check, metric=None, custom=False):
+        """Fetch the points newer than those stored for a node's check
+           and append them
+
+        Stores every metric in the response, or only the named one.
+        Returns a dict mapping metric names to the number of new points.
+        """
+        if metric is not None:
+            names = [metric]
+        else:
+            names = self.metrics(node_id, check)
+        lasts = [self.last_ts(node_id, check, name) for name in names]
+        start = None
+        if lasts and None not in lasts:
+            start = int(min(lasts))
+        if custom:
+            data = conn.nodes.custom_metric_data(node_id, check, start=start)
+        else:
+            data = conn.nodes.metric_data(node_id, check, start=start)
+
+        added = {}
+        for m in data.get('metrics', []):
+            name = m.get('name', check)
+            if metric is not None and name != metric:
+                continue
+            series = MetricSeries.from_points(m['data'], name)
+            added[name] = self.append(node_id, check, name, series)
+        return added
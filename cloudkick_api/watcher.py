@@ -0,0 +1,228 @@
+# Licensed to Cloudkick, Inc ('Cloudkick') under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# Cloudkick licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+__all__ = ["StatusWatcher", "StatusEvent", "ERROR", "RECOVERY", "CHANGE"]
+
+import httplib
+import threading
+
+from cloudkick_api.endpoints import ApiEndPointException
+
+# Kinds of StatusEvent.
+ERROR = 'error'
+RECOVERY = 'recovery'
+CHANGE = 'change'
+
+# States a check is considered healthy in; anything else is failing.
+OK_STATES = frozenset(['ok', 'recovery', 'success'])
+
+
+class StatusEvent(object):
+    """
+    A check that changed state between two polls
+
+    kind is ERROR when a healthy (or unseen) check started failing,
+    RECOVERY when a failing check became healthy or dropped out of a
+    filtered listing, and CHANGE when it went from one failing state to
+    another. old and new are the states; new is None when the check is
+    no longer listed. entry is the check's status dict from the latest
+    response, or None.
+    """
+
+    __slots__ = ('kind', 'node_id', 'check_id', 'old', 'new', 'entry')
+
+    def __init__(self, kind, node_id, check_id, old, new, entry=None):
+        self.kind = kind
+        self.node_id = node_id
+        self.check_id = check_id
+        self.old = old
+        self.new = new
+        self.entry = entry
+
+    def __repr__(self):
+        return "<StatusEvent %s %s/%s %s -> %s>" % (
+            self.kind, self.node_id, self.check_id, self.old, self.new)
+
+
+def _state(check):
+    status = check.get('status')
+    if isinstance(status, dict):
+        status = status.get('state') or status.get('status')
+    if status is None:
+        status = check.get('state')
+    if status is None:
+        return None
+    return intern(str(status).lower())
+
+
+def _statuses(data):
+    """Yield ((node_id, check_id), state, check) for every check status in
+       a status/nodes response"""
+    if isinstance(data, dict):
+        data = data.get('items') or []
+    for item in data or []:
+        node = item.get('node')
+        if isinstance(node, dict):
+            node_id = node.get('id')
+        else:
+            node_id = item.get('node_id', node)
+        checks = item.get('checks')
+        if checks is None:
+            checks = [item]
+        elif isinstance(checks, dict):
+            checks = [dict(v, id=k) for k, v in checks.iteritems()]
+        for check in checks:
+            check_id = check.get('id') or check.get('check_id')
+            state = _state(check)
+            if check_id is not None and state is not None:
+                yield (check.get('node_id', node_id), check_id), state, check
+
+
+def _kind(old, new):
+    old_ok = old is None or old in OK_STATES
+    new_ok = new is None or new in OK_STATES
+    if old_ok and not new_ok:
+        return ERROR
+    if new_ok and not old_ok:
+        return RECOVERY
+    if not old_ok and old != new:
+        return CHANGE
+    return None
+
+
+class StatusWatcher(object):
+    """
+    Polls StatusNodes and reports check state transitions
+
+    The previous state of every check is kept in a dict keyed by
+    (node_id, check_id). Polls are conditional, so while nothing changes
+    the server answers 304 and no diffing is done at all; otherwise each
+    check is compared against the index with one lookup and only
+    transitions produce events.
+
+    The poll interval adapts: it drops to min_interval after a poll that
+    saw changes and grows by backoff per quiet poll, up to max_interval.
+
+    Keyword arguments are passed on as StatusNodes filters, e.g.
+    overall_check_statuses="Error,Warning". Checks missing from a
+    filtered listing are treated as healthy.
+
+        watcher = StatusWatcher(conn, overall_check_statuses="Error")
+        for event in watcher.events():
+            print event
+
+    or watcher.run(callback) to call callback(event) instead; stop()
+    ends either loop from another thread.
+
+    A failed poll, such as an error page or a dropped connection, doesn't
+    end either loop: the known states are kept and the watcher polls
+    again after backing off. on_error(exc), if given, is called with the
+    exception first.
+    """
+
+    def __init__(self, conn, min_interval=5, max_interval=120, backoff=1.5,
+                 initial_events=True, on_error=None, **filters):
+        self.conn = conn
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.initial_events = initial_events
+        self.on_error = on_error
+        self.filters = filters
+        self.interval = min_interval
+        self.states = {}
+        self._polled = False
+        self._stopped = threading.Event()
+
+    def poll(self):
+        """Poll once and return the list of StatusEvents since the last
+           poll
+
+        Raises ApiEndPointException, leaving the known states untouched,
+        if the response isn't a status listing.
+        """
+        data, changed = self.conn.status_nodes.poll(**self.filters)
+        # An error body must not be diffed as an empty fleet, which would
+        # report every failing check as recovered.
+        if not (isinstance(data, dict) and isinstance(data.get('items'),
+                                                      list)):
+            raise ApiEndPointException("Unexpected status response: %r" %
+                                       (str(data)[:200],))
+        # A 304 on the first poll still carries the data the connection
+        # saw last, which the index has to be seeded from.
+        if not changed and self._polled:
+            self._back_off()
+            return []
+        events = self._diff(data)
+        if events:
+            self.interval = self.min_interval
+        else:
+            self._back_off()
+        return events
+
+    def _back_off(self):
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def _diff(self, data):
+        states = self.states
+        emit = self._polled or self.initial_events
+        self._polled = True
+        events = []
+        current = {}
+        kept = 0
+        for key, state, check in _statuses(data):
+            current[key] = state
+            old = states.get(key)
+            if old is not None:
+                kept += 1
+            if old != state:
+                kind = _kind(old, state)
+                if kind is not None and emit:
+                    events.append(StatusEvent(kind, key[0], key[1], old,
+                                              state, check))
+        # Only walk the old index when some of it was dropped from the
+        # listing.
+        if kept < len(states):
+            for key, old in states.iteritems():
+                if key not in current and old not in OK_STATES and emit:
+                    events.append(StatusEvent(RECOVERY, key[0], key[1], old,
+                                              None))
+        self.states = current
+        return events
+
+    def events(self):
+        """Poll until stop() is called, yielding StatusEvents as they
+           occur"""
+        self._stopped.clear()
+        while not self._stopped.isSet():
+            try:
+                events = self.poll()
+            except (ApiEndPointException, IOError, httplib.HTTPException), e:
+                self._back_off()
+                if self.on_error is not None:
+                    self.on_error(e)
+                events = []
+            for event in events:
+                yield event
+            self._stopped.wait(self.interval)
+
+    def run(self, callback):
+        """Call callback(event) for every StatusEvent until stop()"""
+        for event in self.events():
+            callback(event)
+
+    def stop(self):
+        self._stopped.set()
@@ -19,17 +19,20 @@ except:
 
 
 from cloudkick_api.base import Connection
+from cloudkick_api.metrics import MetricSeries
 from pprint import pprint
 from pygooglechart import SimpleLineChart
 from pygooglechart import Axis
 from datetime import datetime, timedelta
 
-def gchart(data, node, check, metric, start=datetime.now()-timedelta(days=1), end=datetime.now()):
-  d = []
-  ts = []
-  for p in  data['metrics'][0]['data']:
-    d.append(float(p['avg']))
-    ts.append(p['ts'])
+def gchart(data, node, check, metric, start=datetime.now()-timedelta(days=1), end=datetime.now(),
+           max_points=None):
+  series = MetricSeries.from_response(data)
+  if max_points:
+    # Keep chart URLs short by sending only the points that shape the line
+    series = series.thin(max_points)
+  d = series.avg.tolist()
+  ts = series.ts
 
   # Chart size of 200x125 pixels and specifying the range for the Y axis
   max_y = int(max(d))
@@ -39,4 +39,9 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
     install_requires='oauth',
+    entry_points={
+        'console_scripts': [
+            'cloudkick = cloudkick_api.cli:main',
+        ],
+    },
 )